@@ -0,0 +1,295 @@
+"""Async wrappers around the database module for use in bot handlers.
+
+Every function here mirrors the function with the same name in ``database``,
+but runs it on a dedicated thread pool so sqlite3 calls never block the event loop.
+Word adds and deletes go through a group-commit writer that commits the writes of
+many users in one transaction.
+"""
+
+import asyncio
+import functools
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import DB_EXECUTOR_WORKERS, WRITE_BATCH_DELAY_MS, WRITE_BATCH_MAX
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# Seconds close() waits for queued writes before giving up on them
+WRITER_CLOSE_TIMEOUT = 30
+
+_executor: Optional[ThreadPoolExecutor] = None
+_writer: Optional["GroupCommitWriter"] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the database thread pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=DB_EXECUTOR_WORKERS,
+            thread_name_prefix="db"
+        )
+    return _executor
+
+
+def shutdown(wait: bool = True) -> None:
+    """Shut down the database thread pool. It is recreated on next use."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+async def run(func, *args, **kwargs):
+    """Run a synchronous database function on the database thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class GroupCommitWriter:
+    """Collects word writes for a few milliseconds and commits them in one transaction.
+    
+    One background task takes everything queued so far, splits it by database file and
+    applies each file's writes with database.apply_word_writes, so hundreds of users adding
+    words share one commit instead of taking turns at the SQLite write lock. Writes queued
+    while a batch is committed form the next batch. Every caller gets its own result.
+    """
+    
+    def __init__(self, delay: float, max_batch: int = 500):
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        
+        self.writes = 0
+        self.batches = 0
+        self.largest_batch = 0
+    
+    async def submit(self, op: str, user_id: int, *args):
+        """Queue a write (see database.apply_word_writes) and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((op, user_id, args, future))
+        self._wakeup.set()
+        self._start()
+        return await future
+    
+    def _start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="GroupCommitWriter")
+            self._task.add_done_callback(self._finished)
+    
+    def _finished(self, task: asyncio.Task) -> None:
+        # A later submit starts a new task instead of waiting for a dead one
+        self._task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Group commit writer failed", exc_info=task.exception())
+    
+    async def _run(self) -> None:
+        """Commit batches until closed and nothing is left to commit."""
+        while not (self._closing and not self._pending):
+            await self._wakeup.wait()
+            if not self._closing and len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if self._pending:
+                self._wakeup.set()
+            if not batch:
+                continue
+            try:
+                await self._commit(batch)
+            except Exception as error:
+                logger.exception("Could not commit %d word writes", len(batch))
+                for write in batch:
+                    if not write[3].done():
+                        write[3].set_exception(error)
+    
+    async def _commit(self, batch: list) -> None:
+        by_path = {}
+        for write in batch:
+            by_path.setdefault(db.user_path(write[1]), []).append(write)
+        
+        paths = list(by_path)
+        outcomes = await asyncio.gather(
+            *(run(db.apply_word_writes, path, [write[:3] for write in by_path[path]]) for path in paths),
+            return_exceptions=True
+        )
+        for path, outcome in zip(paths, outcomes):
+            writes = by_path[path]
+            # The whole transaction failed, e.g. the database was locked for too long
+            results = [outcome] * len(writes) if isinstance(outcome, BaseException) else outcome
+            for write, result in zip(writes, results):
+                future = write[3]
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        
+        self.writes += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+    
+    async def close(self, timeout: float = WRITER_CLOSE_TIMEOUT) -> None:
+        """Let the background task commit the batch in flight and everything queued, then stop.
+        
+        The task is cancelled only if that takes longer than timeout seconds.
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._pending:
+            self._start()
+        task = self._task
+        if task is None:
+            return
+        done, _ = await asyncio.wait([task], timeout=timeout)
+        if not done:
+            logger.error("Group commit writer did not finish in %s s, %d writes dropped",
+                         timeout, len(self._pending))
+            task.cancel()
+            for write in self._pending:
+                write[3].cancel()
+            self._pending = []
+    
+    def stats(self) -> dict:
+        """Get the number of writes and batches committed so far."""
+        return {
+            "writes": self.writes,
+            "batches": self.batches,
+            "avg_batch": self.writes / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "pending": len(self._pending),
+        }
+
+
+def get_writer() -> Optional[GroupCommitWriter]:
+    """Get the group-commit writer, or None if WRITE_BATCH_DELAY_MS turns group commit off."""
+    global _writer
+    if _writer is None and WRITE_BATCH_DELAY_MS > 0:
+        _writer = GroupCommitWriter(WRITE_BATCH_DELAY_MS / 1000, WRITE_BATCH_MAX)
+    return _writer
+
+
+async def close_writer() -> None:
+    """Commit the queued writes and stop the group-commit writer. It is recreated on next use."""
+    global _writer
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+
+
+async def init_db():
+    """Initialize the database with required tables."""
+    return await run(db.init_db)
+
+
+async def register_user(user_id: int, username: Optional[str], first_name: Optional[str]) -> bool:
+    """Register a new user or update the names of a known one. Returns True if new user."""
+    # Returning users with unchanged names are answered from memory
+    if db.is_known_user(user_id, username, first_name):
+        return False
+    return await run(db.register_user, user_id, username, first_name)
+
+
+async def add_translation_word(user_id: int, english: str, russian: str) -> Optional[int]:
+    """Add a translation word pair. Returns the word ID, or None if the user already has it."""
+    writer = get_writer()
+    if writer is not None:
+        return await writer.submit("add_translation", user_id, english, russian)
+    return await run(db.add_translation_word, user_id, english, russian)
+
+
+async def add_irregular_verb(user_id: int, form_from: str, form_to: str, form_pair: str) -> Optional[int]:
+    """Add an irregular verb pair. form_pair is '1-2' or '2-3'.
+    
+    Returns the word ID, or None if the user already has the pair.
+    """
+    writer = get_writer()
+    if writer is not None:
+        return await writer.submit("add_irregular", user_id, form_from, form_to, form_pair)
+    return await run(db.add_irregular_verb, user_id, form_from, form_to, form_pair)
+
+
+async def add_words_bulk(user_id: int, rows: list) -> dict:
+    """Add many words in one transaction, skipping duplicates. Returns the words added by type."""
+    return await run(db.add_words_bulk, user_id, rows)
+
+
+async def get_all_words(user_id: int, word_type: Optional[str] = None) -> list:
+    """Get all words for a user, optionally filtered by type."""
+    return await run(db.get_all_words, user_id, word_type)
+
+
+async def get_last_words(user_id: int, limit: int = 30, word_type: Optional[str] = None) -> list:
+    """Get last N words for a user, optionally filtered by type."""
+    return await run(db.get_last_words, user_id, limit, word_type)
+
+
+async def get_word_ids(user_id: int) -> array:
+    """Get the IDs of all words of a user, read from the index without touching the rows."""
+    return await run(db.get_word_ids, user_id)
+
+
+async def get_words_by_ids(user_id: int, word_ids: list) -> list:
+    """Get the words of a user with the given IDs, in no particular order."""
+    return await run(db.get_words_by_ids, user_id, word_ids)
+
+
+async def get_random_words(user_id: int, word_type: str, form_pair: Optional[str] = None, limit: int = 50) -> list:
+    """Get up to limit random words of one type (and form pair, for irregular verbs)."""
+    return await run(db.get_random_words, user_id, word_type, form_pair, limit)
+
+
+async def get_words_for_wrong_answers(user_id: int, word_type: str, exclude_id: int) -> list:
+    """Get words of the same type for generating wrong answers, excluding the current word."""
+    return await run(db.get_words_for_wrong_answers, user_id, word_type, exclude_id)
+
+
+async def get_word_count(user_id: int, word_type: Optional[str] = None) -> int:
+    """Get the count of words for a user, optionally filtered by type."""
+    return await run(db.get_word_count, user_id, word_type)
+
+
+async def get_words_paginated(user_id: int, offset: int = 0, limit: int = 5) -> list:
+    """Get words for a user with pagination."""
+    return await run(db.get_words_paginated, user_id, offset, limit)
+
+
+async def get_words_page(user_id: int, limit: int = 5, direction: str = "first", position: Optional[tuple] = None) -> list:
+    """Get a page of words, newest first, using keyset pagination on (created_at, id)."""
+    return await run(db.get_words_page, user_id, limit, direction, position)
+
+
+async def search_words(user_id: int, match: str, limit: int = 50) -> list:
+    """Get up to limit words of a user matching an FTS5 query over word1 and word2, by word1."""
+    return await run(db.search_words, user_id, match, limit)
+
+
+async def get_due_words(user_id: int, limit: int = 30) -> list:
+    """Get up to limit words due for review, the longest overdue first."""
+    return await run(db.get_due_words, user_id, limit)
+
+
+async def get_next_due_at(user_id: int) -> Optional[str]:
+    """Get when the next word of a user becomes due, or None if they have no words."""
+    return await run(db.get_next_due_at, user_id)
+
+
+async def record_review(user_id: int, word_id: int, quality: int) -> Optional[str]:
+    """Reschedule a word after a quiz answer of the given SM-2 quality. Returns the new due time."""
+    return await run(db.record_review, user_id, word_id, quality)
+
+
+async def delete_word(user_id: int, word_id: int) -> bool:
+    """Delete a word by ID. Returns True if word was deleted."""
+    writer = get_writer()
+    if writer is not None:
+        return await writer.submit("delete", user_id, word_id)
+    return await run(db.delete_word, user_id, word_id)
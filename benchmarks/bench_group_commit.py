@@ -0,0 +1,89 @@
+"""Benchmark word inserts per second with group commit against a commit per insert.
+
+Many concurrent users add words through async_database.add_translation_word, as the
+add-word conversation does. With --delays 0 every insert is committed on its own on the
+database thread pool; other delays collect inserts for that many milliseconds and commit
+them together with the group-commit writer. Reports inserts per second, insert latency
+percentiles and the average number of inserts per transaction.
+
+Usage:
+    python benchmarks/bench_group_commit.py [--users 200] [--duration 5] [--delays 0 1 2 5]
+        [--synchronous FULL]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_database as adb  # noqa: E402
+import database as db  # noqa: E402
+from bench_webhook import percentile  # noqa: E402
+
+
+async def user(user_id: int, deadline: float, latencies: list) -> None:
+    number = 0
+    while time.perf_counter() < deadline:
+        number += 1
+        started = time.perf_counter()
+        await adb.add_translation_word(user_id, f"word{user_id}x{number}", "слово")
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_delay(delay_ms: float, args: argparse.Namespace) -> dict:
+    adb.WRITE_BATCH_DELAY_MS = delay_ms
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id, deadline, latencies) for user_id in range(1, args.users + 1)))
+    elapsed = time.perf_counter() - started
+
+    writer = adb.get_writer()
+    stats = writer.stats() if writer else {"avg_batch": 1.0}
+    await adb.close_writer()
+    return {
+        "delay_ms": delay_ms,
+        "inserts_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "avg_batch": stats["avg_batch"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="users adding words at the same time")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per run")
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 1, 2, 5],
+                        help="group commit delays in milliseconds; 0 commits every insert")
+    parser.add_argument("--synchronous", default="FULL",
+                        help="PRAGMA synchronous of the connections; FULL syncs every commit to disk")
+    args = parser.parse_args()
+
+    db.SQLITE_SYNCHRONOUS = args.synchronous
+    print(f"{args.users} users adding words, synchronous={args.synchronous}, "
+          f"{adb.DB_EXECUTOR_WORKERS} database threads")
+    baseline = None
+    for delay_ms in args.delays:
+        with tempfile.TemporaryDirectory() as directory:
+            db.DATABASE_NAME = os.path.join(directory, "bench.db")
+            db.init_db()
+            result = asyncio.run(run_delay(delay_ms, args))
+            db.close_pools()
+
+        baseline = baseline or result["inserts_per_second"]
+        name = "commit per insert" if not delay_ms else f"group commit {delay_ms:g} ms"
+        print(f"{name:>20}: {result['inserts_per_second']:8.0f} inserts/s "
+              f"({result['inserts_per_second'] / baseline:.1f}x), p50 {result['p50_ms']:6.2f} ms, "
+              f"p99 {result['p99_ms']:7.2f} ms, {result['avg_batch']:.1f} inserts per commit")
+    adb.shutdown()
+
+
+if __name__ == "__main__":
+    main()
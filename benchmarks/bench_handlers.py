@@ -0,0 +1,396 @@
+"""Benchmark the bot's handlers end to end against seeded databases of several sizes.
+
+For every scale a temporary SQLite database is seeded with synthetic users and words.
+The real handlers from bot.py are then driven through stub Update/Context/Bot objects,
+so each timing covers the handler, the database queries it makes on the thread pool and
+the rendering of its reply, but no network. Each handler gets a timing pass (p50/p95/p99
+latency) and a separate pass under tracemalloc (peak memory allocated per call).
+
+Results are written as JSON. Pass an earlier result file to --compare to print the change.
+
+Usage:
+    python benchmarks/bench_handlers.py [--scales 1000 100000 1000000] [--users 100]
+        [--iterations 200] [--output bench_handlers.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+import async_database as adb  # noqa: E402
+import bot  # noqa: E402
+import page_cache  # noqa: E402
+import quiz  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+class StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = f"User{user_id}"
+
+
+class StubChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class StubMessage:
+    """Records replies instead of sending them."""
+    
+    def __init__(self, chat_id: int, text: str = None):
+        self.chat_id = chat_id
+        self.text = text
+        self.document = None
+        self.last_markup = None
+    
+    async def reply_text(self, text: str, reply_markup=None, **kwargs) -> "StubMessage":
+        self.last_markup = reply_markup
+        return StubMessage(self.chat_id, text)
+    
+    async def edit_text(self, text: str, reply_markup=None, **kwargs) -> "StubMessage":
+        self.last_markup = reply_markup
+        return self
+
+
+class StubCallbackQuery:
+    def __init__(self, chat_id: int, data: str):
+        self.data = data
+        self.message = StubMessage(chat_id)
+        self.last_markup = None
+    
+    async def answer(self, *args, **kwargs) -> bool:
+        return True
+    
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs) -> bool:
+        self.last_markup = reply_markup
+        return True
+
+
+class StubUpdate:
+    """The parts of telegram.Update that the handlers use."""
+    
+    def __init__(self, user_id: int, text: str = None, data: str = None):
+        self.effective_user = StubUser(user_id)
+        self.effective_chat = StubChat(user_id)
+        self.message = StubMessage(user_id, text) if data is None else None
+        self.callback_query = StubCallbackQuery(user_id, data) if data is not None else None
+
+
+class StubBot:
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> StubMessage:
+        return StubMessage(chat_id, text)
+    
+    async def send_document(self, chat_id: int, document, **kwargs) -> StubMessage:
+        document.read()
+        return StubMessage(chat_id)
+
+
+class StubApplication:
+    def create_task(self, coroutine, update=None) -> asyncio.Task:
+        return asyncio.get_running_loop().create_task(coroutine)
+
+
+class StubContext:
+    """The parts of CallbackContext that the handlers use."""
+    
+    def __init__(self, args: list = None):
+        self.user_data = {}
+        self.args = args or []
+        self.bot = StubBot()
+        self.application = StubApplication()
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+
+def seed(rows: int, users: int, rng: random.Random) -> None:
+    """Spread rows evenly over users; every fifth word is an irregular verb pair."""
+    per_user = max(1, rows // users)
+    for user_id in range(1, users + 1):
+        db.register_user(user_id, f"user{user_id}", f"User{user_id}")
+        words = []
+        for word_number in range(per_user):
+            if word_number % 5 == 0:
+                words.append(("irregular", make_word(rng), make_word(rng), rng.choice(("1-2", "2-3"))))
+            else:
+                words.append(("translation", make_word(rng), make_word(rng), None))
+        db.add_words_bulk(user_id, words)
+        quiz.invalidate_word_table(user_id)
+
+
+def nav_callback(markup, prefix: str, rng: random.Random) -> str:
+    """Pick a page button of a keyboard, or jump to the first or last page."""
+    if markup is not None:
+        buttons = [
+            button.callback_data for row in markup.inline_keyboard for button in row
+            if button.callback_data and bot.is_page_callback(button.callback_data)
+        ]
+        if buttons:
+            return rng.choice(buttons)
+    return rng.choice([f"{prefix}_first", f"{prefix}_last"])
+
+
+class Scenarios:
+    """Builds one call of each benchmarked handler. Setup runs before the call is timed."""
+    
+    def __init__(self, users: int, rng: random.Random):
+        self.users = users
+        self.rng = rng
+        self.contexts = {}
+        self.view_markup = {}
+        self.delete_markup = {}
+    
+    def user(self) -> int:
+        return self.rng.randint(1, self.users)
+    
+    async def quiz_context(self, user_id: int) -> StubContext:
+        """Get a context with a running quiz waiting for an answer."""
+        context = self.contexts.setdefault(user_id, StubContext())
+        session = context.user_data.get("quiz")
+        if session is None or session.finished or session.current_question is None:
+            context.user_data.pop("quiz", None)
+            await bot.start_quiz_all(StubUpdate(user_id, "📚 Test All Words"), context)
+        return context
+    
+    async def start(self):
+        user_id = self.user()
+        return lambda: bot.start(StubUpdate(user_id, "/start"), StubContext())
+    
+    async def start_quiz_all(self):
+        user_id = self.user()
+        return lambda: bot.start_quiz_all(StubUpdate(user_id, "📚 Test All Words"), StubContext())
+    
+    async def start_quiz_hard(self):
+        user_id = self.user()
+        return lambda: bot.start_quiz_hard(StubUpdate(user_id, "🎯 Hard Test All Words"), StubContext())
+    
+    async def start_quiz_last30(self):
+        user_id = self.user()
+        return lambda: bot.start_quiz_last30(StubUpdate(user_id, "📝 Test Last 30 Words"), StubContext())
+    
+    async def start_quiz_review(self):
+        user_id = self.user()
+        return lambda: bot.start_quiz_review(StubUpdate(user_id, "🔁 Review Due Words"), StubContext())
+    
+    async def handle_quiz_answer(self):
+        user_id = self.user()
+        context = await self.quiz_context(user_id)
+        return lambda: bot.handle_quiz_answer(StubUpdate(user_id, data="answer_0"), context)
+    
+    async def next_question(self):
+        user_id = self.user()
+        context = await self.quiz_context(user_id)
+        await bot.handle_quiz_answer(StubUpdate(user_id, data="answer_0"), context)
+        return lambda: bot.next_question(StubUpdate(user_id, data="next_question"), context)
+    
+    async def generate_quiz_question(self):
+        user_id = self.user()
+        session = (await self.quiz_context(user_id)).user_data["quiz"]
+        word = session.current_word()
+        return lambda: bot.generate_quiz_question(word, session.distractors)
+    
+    async def view_words_start(self):
+        user_id = self.user()
+        return lambda: bot.view_words_start(StubUpdate(user_id, "👀 View Words"), StubContext())
+    
+    async def handle_view_callback(self):
+        user_id = self.user()
+        update = StubUpdate(user_id, data=nav_callback(self.view_markup.get(user_id), "view", self.rng))
+        
+        async def call():
+            await bot.handle_view_callback(update, StubContext())
+            self.view_markup[user_id] = update.callback_query.last_markup
+        return call
+    
+    async def build_view_words_message(self):
+        words = await adb.get_words_page(self.user(), bot.VIEW_WORDS_PER_PAGE)
+        return lambda: bot.build_view_words_message(words, page=3, total_pages=10)
+    
+    async def delete_word_start(self):
+        user_id = self.user()
+        return lambda: bot.delete_word_start(StubUpdate(user_id, "🗑 Delete Word"), StubContext())
+    
+    async def handle_delete_callback(self):
+        user_id = self.user()
+        update = StubUpdate(user_id, data=nav_callback(self.delete_markup.get(user_id), "del", self.rng))
+        
+        async def call():
+            await bot.handle_delete_callback(update, StubContext())
+            self.delete_markup[user_id] = update.callback_query.last_markup
+        return call
+    
+    async def export(self):
+        user_id = self.user()
+        return lambda: bot.send_export(StubContext(), user_id, user_id, "csv")
+
+
+HANDLERS = [
+    "start",
+    "start_quiz_all",
+    "start_quiz_hard",
+    "start_quiz_last30",
+    "start_quiz_review",
+    "handle_quiz_answer",
+    "next_question",
+    "generate_quiz_question",
+    "view_words_start",
+    "handle_view_callback",
+    "build_view_words_message",
+    "delete_word_start",
+    "handle_delete_callback",
+    "export",
+]
+
+
+async def invoke(call) -> None:
+    result = call()
+    if inspect.isawaitable(result):
+        await result
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Get a percentile of a list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def measure(scenarios: Scenarios, name: str, iterations: int, alloc_iterations: int) -> dict:
+    """Time a handler, then measure its allocations in a separate pass."""
+    make_call = getattr(scenarios, name)
+    
+    timings = []
+    for _ in range(iterations):
+        call = await make_call()
+        started = time.perf_counter()
+        await invoke(call)
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    peaks = []
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        call = await make_call()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await invoke(call)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    
+    return {
+        "handler": name,
+        "iterations": iterations,
+        "mean_ms": round(statistics.mean(timings), 4),
+        "p50_ms": round(percentile(timings, 0.50), 4),
+        "p95_ms": round(percentile(timings, 0.95), 4),
+        "p99_ms": round(percentile(timings, 0.99), 4),
+        "alloc_peak_kib": round(statistics.mean(peaks) / 1024, 2) if peaks else None,
+    }
+
+
+async def run_scale(rows: int, args: argparse.Namespace) -> list:
+    """Seed a fresh database with rows words and benchmark every handler on it."""
+    rng = random.Random(args.seed)
+    users = min(args.users, rows)
+    results = []
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE_NAME = os.path.join(directory, "bench.db")
+        db.init_db()
+        
+        started = time.perf_counter()
+        seed(rows, users, rng)
+        print(f"\n{rows} words for {users} users seeded in {time.perf_counter() - started:.1f} s")
+        print(f"{'handler':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc KiB':>12}")
+        
+        scenarios = Scenarios(users, rng)
+        for name in args.handlers:
+            result = await measure(scenarios, name, args.iterations, args.alloc_iterations)
+            result["scale"] = rows
+            results.append(result)
+            print(f"{name:<26}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+                  f"{result['alloc_peak_kib']:>12.1f}")
+        
+        adb.shutdown()
+        db.close_pools()
+    
+    return results
+
+
+def compare(results: list, path: str) -> None:
+    """Print the p50/p95 change of every handler against an earlier result file."""
+    with open(path) as file:
+        previous = {(result["scale"], result["handler"]): result for result in json.load(file)["results"]}
+    
+    print(f"\nCompared with {path}:")
+    for result in results:
+        old = previous.get((result["scale"], result["handler"]))
+        if old is None:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            if old[key]:
+                changes.append(f"{key[:3]} {(result[key] / old[key] - 1) * 100:+.0f}%")
+        print(f"  {result['scale']:>8} {result['handler']:<26}{'  '.join(changes)}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = []
+    for rows in args.scales:
+        results.extend(await run_scale(rows, args))
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": args.users,
+            "iterations": args.iterations,
+            "page_cache": page_cache.get_stats(),
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--alloc-iterations", type=int, default=50)
+    parser.add_argument("--handlers", nargs="+", choices=HANDLERS, default=HANDLERS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_handlers.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    args = parser.parse_args()
+    
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults saved to {args.output}")
+    
+    if args.compare:
+        compare(report["results"], args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark importing a large CSV document into the vocabulary.
+
+Generates a document with translations and irregular verb pairs, imports it with
+importer.ImportJob into a temporary database and reports rows per second. For comparison
+it also times adding words one by one, as the add-word conversation does.
+
+Usage:
+    python benchmarks/bench_import.py [--rows 100000] [--batch-size 5000] [--single-rows 2000]
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+import importer  # noqa: E402
+
+
+def make_document(rows: int, rng: random.Random) -> bytes:
+    """Build a semicolon separated document with a header and a few invalid lines."""
+    lines = ["english;russian;forms"]
+    for row_number in range(rows):
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+        if row_number % 10 == 0:
+            lines.append(f"{word};{word}ed;{rng.choice(importer.FORM_PAIRS)}")
+        elif row_number % 1000 == 999:
+            lines.append(word)
+        else:
+            lines.append(f"{word};слово{row_number}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=importer.IMPORT_BATCH_SIZE)
+    parser.add_argument("--single-rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    document = make_document(args.rows, rng)
+    print(f"Document: {args.rows} rows, {len(document) / 1024 / 1024:.1f} MiB")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE_NAME = os.path.join(directory, "bench.db")
+        db.init_db()
+        
+        with tempfile.TemporaryFile() as raw:
+            raw.write(document)
+            raw.seek(0)
+            
+            started = time.perf_counter()
+            job = importer.ImportJob(1, raw)
+            batches = 0
+            while job.import_batch(args.batch_size):
+                batches += 1
+            elapsed = time.perf_counter() - started
+        
+        print(f"Bulk import: {job.imported} added, {job.skipped} skipped in {elapsed:.2f} s "
+              f"({job.imported / elapsed:,.0f} rows/s, {batches} transactions of up to {args.batch_size})")
+        
+        started = time.perf_counter()
+        for row_number in range(args.single_rows):
+            db.add_translation_word(2, f"single{row_number}", f"один{row_number}")
+        elapsed = time.perf_counter() - started
+        rate = args.single_rows / elapsed
+        print(f"One by one:  {args.single_rows} added in {elapsed:.2f} s ({rate:,.0f} rows/s, "
+              f"{args.rows / rate:.1f} s for {args.rows} rows)")
+        
+        with db.get_connection() as conn:
+            reviews = conn.execute("SELECT COUNT(*) FROM reviews WHERE user_id = 1").fetchone()[0]
+        print(f"Review schedules created by the insert trigger: {reviews}")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
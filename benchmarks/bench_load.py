@@ -0,0 +1,313 @@
+"""End-to-end load test of the bot with scripted virtual users.
+
+Runs bot.py against the fake Bot API (fake_bot_api.py) like bench_webhook.py, but the
+virtual users go through the real flows instead of repeating one command: adding a word,
+taking a quiz and paging through the word list, pressing the inline buttons the bot sent.
+Each user waits for the bot's replies to a step, thinks for a moment and takes the next one.
+
+The number of users is raised in stages. For every stage the report shows completed steps
+per second, step latency percentiles and how many handlers and database queries were running
+on average (from the bot's metrics endpoint). The stage where throughput stops growing while
+latency climbs is where the bot saturates.
+
+Usage:
+    python benchmarks/bench_load.py [--stages 50 100 250 500 1000] [--duration 20]
+        [--think 1.0] [--words 30] [--mode polling] [--concurrent-updates 16] [--api-latency 0]
+        [--output load.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+from bench_webhook import Harness, percentile  # noqa: E402
+from fake_bot_api import inline_buttons, make_callback_update, make_message_update  # noqa: E402
+
+# Share of each flow in the traffic
+FLOWS = {"add_word": 3, "quiz": 5, "view": 2}
+# Questions answered before a user quits a quiz
+QUIZ_QUESTIONS = 5
+# Pages turned forward in the word list
+VIEW_PAGES = 2
+# A step that takes longer counts as timed out and its user stops
+STEP_TIMEOUT = 60
+# Throughput growth below this between stages marks saturation
+SATURATION_GROWTH = 1.1
+
+QUESTION_PATTERN = re.compile(r"Question (\d+)/(\d+)")
+METRIC_SUMS = {
+    "handlers": "engdiary_handler_duration_seconds_sum",
+    "database": "engdiary_db_query_duration_seconds_sum",
+}
+
+
+def seed_database(path: str, users: int, words: int) -> None:
+    """Create the bot's database with words for every virtual user."""
+    db.DATABASE_NAME = path
+    db.init_db()
+    for user_id in range(1, users + 1):
+        rows = [("translation", f"word{user_id}x{number}", f"слово{number}", None) for number in range(words)]
+        db.add_words_bulk(user_id, rows)
+    db.close_pools()
+
+
+class StageStats:
+    """Step latencies of one stage."""
+    
+    def __init__(self):
+        self.latencies = {}
+        self.timeouts = 0
+    
+    def record(self, step: str, seconds: float) -> None:
+        self.latencies.setdefault(step, []).append(seconds)
+    
+    def summary(self, seconds: float) -> dict:
+        every_step = [latency for samples in self.latencies.values() for latency in samples]
+        steps = {
+            step: {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p95_ms": percentile(samples, 0.95) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+            }
+            for step, samples in sorted(self.latencies.items())
+        }
+        return {
+            "steps": len(every_step),
+            "steps_per_second": len(every_step) / seconds,
+            "p50_ms": percentile(every_step, 0.50) * 1000 if every_step else 0.0,
+            "p95_ms": percentile(every_step, 0.95) * 1000 if every_step else 0.0,
+            "p99_ms": percentile(every_step, 0.99) * 1000 if every_step else 0.0,
+            "timeouts": self.timeouts,
+            "by_step": steps,
+        }
+
+
+class LoadHarness(Harness):
+    """Harness that hands every reply to the queue of the user it was sent to."""
+    
+    def __init__(self, mode: str, concurrent_updates: int, api_latency: float, **options):
+        super().__init__(mode, concurrent_updates, api_latency, **options)
+        self.replies = {}
+        self.stats = StageStats()
+    
+    def on_reply(self, method: str, chat_id: int, message: dict) -> None:
+        replies = self.replies.get(chat_id)
+        if replies is not None:
+            replies.put_nowait(message)
+    
+    async def deliver(self, update: dict) -> None:
+        if self.mode == "polling":
+            self.api.push_update(update)
+            return
+        status = await self.post_update(update)
+        if status != 200:
+            raise RuntimeError(f"Webhook answered {status}")
+    
+    async def metric_sums(self) -> dict:
+        """Read the total seconds spent in handlers and database queries so far."""
+        response = await self.http.fetch(f"http://127.0.0.1:{self.metrics_port}/metrics")
+        sums = dict.fromkeys(METRIC_SUMS, 0.0)
+        for line in response.body.decode().splitlines():
+            for key, prefix in METRIC_SUMS.items():
+                if line.startswith(prefix):
+                    sums[key] += float(line.rsplit(" ", 1)[1])
+        return sums
+
+
+class VirtualUser:
+    """A user going through the bot's flows, one step at a time."""
+    
+    def __init__(self, harness: LoadHarness, user_id: int, think: float, rng: random.Random):
+        self.harness = harness
+        self.user_id = user_id
+        self.think = think
+        self.rng = rng
+        self.words_added = 0
+        # Last message with inline buttons; button presses are sent for it
+        self.inline_message = None
+        self.replies = harness.replies[user_id] = asyncio.Queue()
+    
+    async def step(self, name: str, update: dict, replies: int) -> list:
+        """Send an update and wait for the given number of replies."""
+        started = time.perf_counter()
+        await self.harness.deliver(update)
+        messages = []
+        for _ in range(replies):
+            messages.append(await asyncio.wait_for(self.replies.get(), STEP_TIMEOUT))
+        self.harness.stats.record(name, time.perf_counter() - started)
+        
+        for message in messages:
+            if inline_buttons(message):
+                self.inline_message = message
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        return messages
+    
+    async def text(self, name: str, text: str, replies: int = 1) -> list:
+        update = make_message_update(next(self.harness.update_ids), self.user_id, text)
+        return await self.step(name, update, replies)
+    
+    async def press(self, name: str, data: str, replies: int = 1) -> list:
+        if data not in inline_buttons(self.inline_message or {}):
+            raise RuntimeError(f"User {self.user_id} has no {data!r} button to press")
+        update = make_callback_update(next(self.harness.update_ids), self.user_id, self.inline_message, data)
+        return await self.step(name, update, replies)
+    
+    async def add_word(self) -> None:
+        self.words_added += 1
+        await self.text("add_word_start", "➕ Add Word")
+        await self.press("add_word_type", "type_translation")
+        await self.text("add_word1", f"added{self.user_id}x{self.words_added}")
+        await self.text("add_word2", f"добавлено{self.words_added}")
+    
+    async def quiz(self) -> None:
+        [question] = await self.text("quiz_start", "📚 Test All Words")
+        total = int(QUESTION_PATTERN.search(question["text"]).group(2))
+        
+        for answered in range(1, total + 1):
+            options = [data for data in inline_buttons(question) if data.startswith("answer_")]
+            await self.press("quiz_answer", self.rng.choice(options))
+            if answered == total:
+                # The last "next" edits in the result and sends the main menu
+                await self.press("quiz_finish", "next_question", replies=2)
+                return
+            [question] = await self.press("quiz_next", "next_question")
+            if answered == QUIZ_QUESTIONS:
+                await self.press("quiz_quit", "quit_quiz", replies=2)
+                return
+    
+    async def view(self) -> None:
+        [page] = await self.text("view_start", "👀 View Words")
+        for _ in range(VIEW_PAGES):
+            forward = [data for data in inline_buttons(page) if data.startswith("view_next_")]
+            if not forward:
+                break
+            [page] = await self.press("view_page", forward[0])
+        await self.press("view_close", "view_close")
+    
+    async def run(self, stop: asyncio.Event) -> None:
+        flows = [getattr(self, flow) for flow in FLOWS]
+        weights = list(FLOWS.values())
+        try:
+            await self.text("start", "/start")
+            while not stop.is_set():
+                await self.rng.choices(flows, weights)[0]()
+        except asyncio.TimeoutError:
+            self.harness.stats.timeouts += 1
+
+
+async def run(args: argparse.Namespace) -> dict:
+    harness = LoadHarness(args.mode, args.concurrent_updates, args.api_latency)
+    rng = random.Random(args.seed)
+    stages = []
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Seeding {max(args.stages)} users with {args.words} words each...")
+        seed_database(os.path.join(workdir, db.DATABASE_NAME), max(args.stages), args.words)
+        await harness.start(workdir)
+        
+        stop = asyncio.Event()
+        tasks = []
+        try:
+            for users in args.stages:
+                # Users of earlier stages keep going; new ones join with their own random stream
+                for user_id in range(len(tasks) + 1, users + 1):
+                    user = VirtualUser(harness, user_id, args.think, random.Random(rng.random()))
+                    tasks.append(asyncio.create_task(user.run(stop)))
+                
+                await asyncio.sleep(args.warmup)
+                harness.stats = StageStats()
+                before = await harness.metric_sums()
+                started = time.perf_counter()
+                await asyncio.sleep(args.duration)
+                elapsed = time.perf_counter() - started
+                after = await harness.metric_sums()
+                
+                result = harness.stats.summary(elapsed)
+                result["users"] = users
+                for key in METRIC_SUMS:
+                    result[f"{key}_in_flight"] = (after[key] - before[key]) / elapsed
+                stages.append(result)
+                print(
+                    f"{users:>6} users: {result['steps_per_second']:7.1f} steps/s, "
+                    f"p50 {result['p50_ms']:7.1f} ms, p95 {result['p95_ms']:7.1f} ms, "
+                    f"p99 {result['p99_ms']:7.1f} ms, in flight: handlers {result['handlers_in_flight']:.1f}, "
+                    f"queries {result['database_in_flight']:.2f}, timeouts {result['timeouts']}"
+                )
+        finally:
+            stop.set()
+            await asyncio.wait(tasks, timeout=STEP_TIMEOUT)
+            for task in tasks:
+                task.cancel()
+            await harness.stop()
+    
+    saturated = None
+    for previous, current in zip(stages, stages[1:]):
+        if current["steps_per_second"] < previous["steps_per_second"] * SATURATION_GROWTH:
+            saturated = previous["users"]
+            break
+    if saturated is None:
+        print("Throughput still grows at the last stage; add larger stages to find saturation")
+    else:
+        print(f"Saturated at about {saturated} users "
+              f"({max(stage['steps_per_second'] for stage in stages):.0f} steps/s at most)")
+    
+    print("\nSteps of the last stage:")
+    for step, summary in stages[-1]["by_step"].items():
+        print(f"  {step:<16} {summary['count']:>7}  p50 {summary['p50_ms']:7.1f} ms  "
+              f"p95 {summary['p95_ms']:7.1f} ms  p99 {summary['p99_ms']:7.1f} ms")
+    print("API calls:", dict(sorted(harness.api.calls.items())))
+    
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "concurrent_updates": args.concurrent_updates,
+            "api_latency_seconds": args.api_latency,
+            "think_seconds": args.think,
+            "words_per_user": args.words,
+            "stage_seconds": args.duration,
+        },
+        "saturated_at_users": saturated,
+        "stages": stages,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", type=int, nargs="+", default=[50, 100, 250, 500, 1000])
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per stage")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring a stage")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between steps of a user")
+    parser.add_argument("--words", type=int, default=30, help="words seeded per user")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--concurrent-updates", type=int, default=16)
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="seconds the fake Bot API takes per call, e.g. 0.05 for a real round trip")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+    
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
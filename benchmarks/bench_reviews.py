@@ -0,0 +1,94 @@
+"""Benchmark selecting due review words from a large shared database.
+
+Seeds a temporary database with word rows spread across many users (the insert trigger
+creates their review rows), then times get_due_words() for random users.
+
+Usage:
+    python benchmarks/bench_reviews.py [--words 1000000] [--users 2000] [--queries 500]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+
+
+def seed(words: int, users: int, rng: random.Random) -> None:
+    """Insert words with creation times spread over the last year."""
+    start = datetime.now() - timedelta(days=365)
+    batch = []
+    with db.get_connection() as conn:
+        for word_number in range(words):
+            created_at = (start + timedelta(seconds=rng.randrange(365 * 24 * 3600))).isoformat()
+            batch.append((rng.randrange(users), "translation", f"w{word_number}", f"r{word_number}", created_at))
+            if len(batch) == 50_000:
+                conn.executemany(
+                    "INSERT INTO words (user_id, word_type, word1, word2, created_at) VALUES (?, ?, ?, ?, ?)",
+                    batch
+                )
+                conn.commit()
+                batch.clear()
+        if batch:
+            conn.executemany(
+                "INSERT INTO words (user_id, word_type, word1, word2, created_at) VALUES (?, ?, ?, ?, ?)",
+                batch
+            )
+            conn.commit()
+        # Push half of the schedule into the future, as if those words were reviewed
+        future = (datetime.now() + timedelta(days=30)).isoformat()
+        conn.execute("UPDATE reviews SET due_at = ? WHERE word_id % 2 = 0", (future,))
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE_NAME = os.path.join(directory, "bench.db")
+        db.init_db()
+        
+        started = time.perf_counter()
+        seed(args.words, args.users, rng)
+        print(f"Seeded {args.words} words for {args.users} users in {time.perf_counter() - started:.1f} s")
+        
+        with db.get_connection() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT w.* FROM reviews r JOIN words w ON w.id = r.word_id "
+                "WHERE r.user_id = ? AND r.due_at <= ? ORDER BY r.due_at LIMIT ?",
+                (1, datetime.now().isoformat(), 30)
+            ).fetchall()
+        for row in plan:
+            print(f"  plan: {row[3]}")
+        
+        timings = []
+        for _ in range(args.queries):
+            user_id = rng.randrange(args.users)
+            started = time.perf_counter()
+            due = db.get_due_words(user_id, 30)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert len(due) <= 30
+        
+        timings.sort()
+        print(f"get_due_words(limit=30) over {args.queries} users: "
+              f"mean {statistics.mean(timings):.3f} ms, p50 {timings[len(timings) // 2]:.3f} ms, "
+              f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
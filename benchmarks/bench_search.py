@@ -0,0 +1,105 @@
+"""Benchmark vocabulary search latency on a large database.
+
+Seeds --users users with --words words each (1M rows by default) made of random syllables,
+then searches the words of random users with database.search_words for prefixes of 1 to 5
+letters and reports latency percentiles per prefix length. Finally types random words one
+letter at a time through search.find_words, as inline queries arrive, and reports how many
+keystrokes were answered from the cache.
+
+Usage:
+    python benchmarks/bench_search.py [--users 2000] [--words 500] [--searches 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_database as adb  # noqa: E402
+import database as db  # noqa: E402
+import search  # noqa: E402
+from bench_webhook import percentile  # noqa: E402
+
+SYLLABLES = ["ta", "ke", "ri", "mo", "lu", "sa", "ne", "po", "di", "ga", "ver", "son", "tal", "mit", "ber"]
+RUSSIAN_SYLLABLES = ["ка", "ло", "ми", "ре", "ту", "ва", "но", "се", "до", "пи"]
+
+
+def random_word(rng: random.Random, syllables: list) -> str:
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+
+
+def seed_database(users: int, words: int, rng: random.Random) -> int:
+    """Add random words for every user. Returns the number of words added; duplicates are skipped."""
+    added = 0
+    for user_id in range(1, users + 1):
+        rows = [
+            ("translation", random_word(rng, SYLLABLES), random_word(rng, RUSSIAN_SYLLABLES), None)
+            for _ in range(words)
+        ]
+        added += sum(db.add_words_bulk(user_id, rows).values())
+    return added
+
+
+def bench_queries(args: argparse.Namespace, rng: random.Random) -> None:
+    for length in range(1, 6):
+        latencies = []
+        found = 0
+        for _ in range(args.searches):
+            prefix = random_word(rng, SYLLABLES)[:length]
+            started = time.perf_counter()
+            rows = db.search_words(rng.randint(1, args.users), search.build_match((prefix,)), search.SEARCH_LIMIT)
+            latencies.append(time.perf_counter() - started)
+            found += len(rows)
+        print(f"prefix of {length} letters: p50 {percentile(latencies, 0.50) * 1000:6.2f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms, {found / args.searches:5.1f} rows")
+
+
+async def bench_typing(args: argparse.Namespace, rng: random.Random) -> None:
+    latencies = []
+    for _ in range(args.searches // 5):
+        user_id = rng.randint(1, args.users)
+        word = random_word(rng, SYLLABLES)
+        for end in range(1, len(word) + 1):
+            started = time.perf_counter()
+            await search.find_words(user_id, word[:end])
+            latencies.append(time.perf_counter() - started)
+    
+    stats = search.get_stats()
+    cached = stats["hits"] + stats["refined"]
+    print(f"typing {len(latencies)} keystrokes: p50 {percentile(latencies, 0.50) * 1000:6.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms, {cached / len(latencies):.0%} from the cache "
+          f"({stats['refined']} filtered from a shorter prefix)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=500, help="words seeded per user")
+    parser.add_argument("--searches", type=int, default=2000, help="searches per prefix length")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE_NAME = os.path.join(directory, "bench.db")
+        db.init_db()
+        started = time.perf_counter()
+        added = seed_database(args.users, args.words, rng)
+        print(f"Seeded {added} words of {args.users} users "
+              f"in {time.perf_counter() - started:.1f} s, {db.SHARDS} shards")
+        
+        bench_queries(args, rng)
+        asyncio.run(bench_typing(args, rng))
+        db.close_pools()
+    adb.shutdown()
+
+
+if __name__ == "__main__":
+    main()
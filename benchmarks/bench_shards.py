@@ -0,0 +1,103 @@
+"""Benchmark concurrent write throughput with the words split over 1, 4 and 16 shards.
+
+Writer threads add words for random users with database.add_translation_word, as the
+database thread pool does when many users add words at once, and a share of them are
+deleted again. Every shard file has its own write lock, so writes of users in different
+shards do not wait for each other. Reports writes per second and write latency percentiles.
+
+Usage:
+    python benchmarks/bench_shards.py [--shards 1 4 16] [--threads 16] [--duration 5]
+        [--users 1000] [--synchronous NORMAL]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+import reshard  # noqa: E402
+from bench_webhook import percentile  # noqa: E402
+
+# Share of writes that delete one of the words the thread added before
+DELETE_SHARE = 0.2
+
+
+def writer(users: int, deadline: float, seed: int, latencies: list) -> None:
+    rng = random.Random(seed)
+    added = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if added and rng.random() < DELETE_SHARE:
+            db.delete_word(*added.pop(rng.randrange(len(added))))
+        else:
+            user_id = rng.randint(1, users)
+            added.append((user_id, db.add_translation_word(user_id, f"word{rng.random()}", "слово")))
+        latencies.append(time.perf_counter() - started)
+
+
+def run_shards(shards: int, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE_NAME = os.path.join(directory, "bench.db")
+        db.SHARDS = shards
+        db.init_db()
+        for user_id in range(1, args.users + 1):
+            db.register_user(user_id, None, None)
+        
+        latencies = [[] for _ in range(args.threads)]
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=writer, args=(args.users, deadline, args.seed + number, latencies[number]))
+            for number in range(args.threads)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        
+        users_per_shard = [len(reshard.shard_users(db.shard_path(index))) for index in range(shards)]
+        db.close_pools()
+    
+    every_write = [latency for samples in latencies for latency in samples]
+    return {
+        "shards": shards,
+        "writes_per_second": len(every_write) / elapsed,
+        "p50_ms": percentile(every_write, 0.50) * 1000,
+        "p99_ms": percentile(every_write, 0.99) * 1000,
+        "users_per_shard": f"{min(users_per_shard)}-{max(users_per_shard)}",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--threads", type=int, default=16, help="concurrent writers")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per shard count")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--synchronous", default=db.SQLITE_SYNCHRONOUS,
+                        help="PRAGMA synchronous of the connections; FULL makes every commit sync to disk")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    db.SQLITE_SYNCHRONOUS = args.synchronous
+    print(f"{args.threads} writer threads, {args.users} users, synchronous={args.synchronous}, "
+          f"{db.DB_POOL_SIZE} connections per shard")
+    baseline = None
+    for shards in args.shards:
+        result = run_shards(shards, args)
+        baseline = baseline or result["writes_per_second"]
+        print(f"{shards:>4} shards: {result['writes_per_second']:8.0f} writes/s "
+              f"({result['writes_per_second'] / baseline:.1f}x), p50 {result['p50_ms']:6.2f} ms, "
+              f"p99 {result['p99_ms']:7.2f} ms, users per shard {result['users_per_shard']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark hard distractor lookups: trigram index vs a brute-force Levenshtein scan.
+
+Usage:
+    python benchmarks/bench_similarity.py [--sizes 10000 100000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import TrigramIndex, levenshtein  # noqa: E402
+
+ONSETS = ["", "b", "br", "c", "ch", "d", "f", "g", "gr", "h", "k", "l", "m", "n", "p", "pl",
+          "r", "s", "sh", "st", "t", "th", "tr", "v", "w", "wh"]
+VOWELS = ["a", "e", "i", "o", "u", "ea", "ou", "ai", "ee"]
+CODAS = ["", "n", "nd", "nt", "r", "s", "st", "t", "ng", "ck", "ll", "d"]
+
+
+def make_word(rng: random.Random) -> str:
+    """Make a pronounceable English-like word of one to three syllables."""
+    return "".join(
+        rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+        for _ in range(rng.randint(1, 3))
+    )
+
+
+def brute_force_similar(texts: list, text: str, count: int = 3) -> list:
+    """Rank every distinct text by edit distance."""
+    scored = sorted((levenshtein(text, candidate), candidate) for candidate in texts if candidate != text)
+    return [candidate for _, candidate in scored[:count]]
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Get a percentile of a list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(size: int, queries: int, brute_queries: int, rng: random.Random) -> None:
+    """Benchmark one vocabulary size and print the results."""
+    words = [make_word(rng) for _ in range(size)]
+    index = TrigramIndex()
+    
+    started = time.perf_counter()
+    for word_id, word in enumerate(words):
+        index.add(word_id, word)
+    build_ms = (time.perf_counter() - started) * 1000
+    
+    probes = rng.sample(words, queries)
+    index_ms = []
+    for probe in probes:
+        started = time.perf_counter()
+        index.similar(probe)
+        index_ms.append((time.perf_counter() - started) * 1000)
+    
+    distinct = list(set(words))
+    brute_ms = []
+    same_best = 0
+    for probe in probes[:brute_queries]:
+        started = time.perf_counter()
+        expected = brute_force_similar(distinct, probe)
+        brute_ms.append((time.perf_counter() - started) * 1000)
+        found = index.similar(probe)
+        if found and expected and levenshtein(probe, found[0]) == levenshtein(probe, expected[0]):
+            same_best += 1
+    
+    print(f"{size:>8} words ({len(distinct)} distinct), index built in {build_ms:.0f} ms")
+    print(f"  trigram index: mean {statistics.mean(index_ms):.3f} ms, "
+          f"p50 {percentile(index_ms, 0.5):.3f} ms, p99 {percentile(index_ms, 0.99):.3f} ms")
+    print(f"  brute force:   mean {statistics.mean(brute_ms):.1f} ms over {len(brute_ms)} queries")
+    print(f"  closest answer matches brute force in {same_best}/{len(brute_ms)} queries")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--brute-queries", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, args.queries, args.brute_queries, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Benchmark update throughput and ordering of the update processors.
+
+Feeds interleaved updates of many users through a processor the way the Application does and
+simulates handlers that wait for the Bot API (--latency) and do a little work. Compares:
+
+- sequential: one update at a time (concurrent_updates=1)
+- unordered: python-telegram-bot's SimpleUpdateProcessor with N concurrent updates, a task
+  per update; updates of one user may overlap or run out of order
+- ordered: UserOrderedUpdateProcessor with N workers
+
+Reports updates per second and how often a user's updates overlapped or ran out of order.
+
+Usage:
+    python benchmarks/bench_update_processor.py [--users 500] [--updates 4] [--burst 2]
+        [--latency 0.02] [--workers 4 16 64] [--max-pending 1000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_processor import UserOrderedUpdateProcessor  # noqa: E402
+
+
+class OrderCheck:
+    """Simulated handler that records overlapping and out-of-order updates per user."""
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.last_seen = {}
+        self.running = set()
+        self.overlaps = 0
+        self.out_of_order = 0
+    
+    async def handle(self, update: SimpleNamespace) -> None:
+        user_id = update.effective_user.id
+        if user_id in self.running:
+            self.overlaps += 1
+        if update.sequence != self.last_seen.get(user_id, -1) + 1:
+            self.out_of_order += 1
+        self.running.add(user_id)
+        self.last_seen[user_id] = update.sequence
+        # A reply to the Bot API, then some rendering
+        await asyncio.sleep(self.latency)
+        sum(range(200))
+        self.running.discard(user_id)
+
+
+def make_updates(users: int, updates: int, burst: int) -> list:
+    """Users take turns, each sending burst updates in a row (like a double click)."""
+    return [
+        SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None, sequence=sequence)
+        for first in range(0, updates, burst)
+        for user_id in range(users)
+        for sequence in range(first, min(first + burst, updates))
+    ]
+
+
+async def run_processor(name: str, processor, updates: list, latency: float) -> dict:
+    check = OrderCheck(latency)
+    tasks = []
+    await processor.initialize()
+    started = time.perf_counter()
+    
+    for update in updates:
+        if processor.max_concurrent_updates > 1:
+            # What the Application does with concurrent updates: a task per update
+            tasks.append(asyncio.create_task(processor.process_update(update, check.handle(update))))
+        else:
+            await processor.process_update(update, check.handle(update))
+    await asyncio.gather(*tasks)
+    if hasattr(processor, "drain"):
+        await processor.drain()
+    
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+    result = {
+        "name": name,
+        "updates_per_second": len(updates) / elapsed,
+        "seconds": elapsed,
+        "overlaps": check.overlaps,
+        "out_of_order": check.out_of_order,
+    }
+    if hasattr(processor, "stats"):
+        result.update(processor.stats())
+    return result
+
+
+async def run(args: argparse.Namespace) -> None:
+    updates = make_updates(args.users, args.updates, args.burst)
+    print(f"{args.users} users x {args.updates} updates in bursts of {args.burst}, simulated Bot API latency {args.latency * 1000:.0f} ms")
+    
+    runs = []
+    if len(updates) * args.latency <= args.max_sequential_seconds:
+        runs.append(("sequential", SimpleUpdateProcessor(1)))
+    else:
+        print(f"(sequential skipped: would take about {len(updates) * args.latency:.0f} s)")
+    for workers in args.workers:
+        runs.append((f"unordered x{workers}", SimpleUpdateProcessor(workers)))
+        runs.append((f"ordered x{workers}", UserOrderedUpdateProcessor(
+            max_workers=workers, max_pending=args.max_pending, max_pending_per_user=args.updates
+        )))
+    
+    for name, processor in runs:
+        result = await run_processor(name, processor, updates, args.latency)
+        line = (f"{result['name']:>16}: {result['updates_per_second']:8.0f} updates/s, "
+                f"overlaps {result['overlaps']}, out of order {result['out_of_order']}")
+        if "peak_pending" in result:
+            line += f", peak pending {result['peak_pending']}, backpressure waits {result['backpressure_waits']}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=4, help="updates per user")
+    parser.add_argument("--burst", type=int, default=2, help="updates a user sends in a row")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds a handler waits for the Bot API")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--max-sequential-seconds", type=float, default=60)
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Compare update throughput and latency of long polling and webhook mode.
+
+Starts the fake Bot API (fake_bot_api.py), runs bot.py against it in a temporary directory
+and lets virtual users send messages. Each user waits for the bot's reply before sending
+the next one. In polling mode the updates are handed out by getUpdates; in webhook mode
+they are POSTed to the bot's webhook server with the secret token.
+
+Usage:
+    python benchmarks/bench_webhook.py [--mode both] [--users 50] [--messages 20]
+        [--text /start] [--concurrent-updates 1]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotApi, make_message_update  # noqa: E402
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+WEBHOOK_SECRET = "bench-secret"
+START_TIMEOUT = 30
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Get a percentile of a list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def free_port() -> int:
+    """Get a free TCP port on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Harness:
+    """One bot process and the fake Bot API it talks to."""
+    
+    def __init__(self, mode: str, concurrent_updates: int, api_latency: float = 0.0,
+                 script: str = BOT_PATH, env: Optional[dict] = None):
+        self.mode = mode
+        self.concurrent_updates = concurrent_updates
+        self.script = script
+        self.env = env or {}
+        self.api = FakeBotApi(on_reply=self.on_reply, latency=api_latency)
+        self.webhook_port = free_port()
+        self.metrics_port = free_port()
+        self.http = AsyncHTTPClient(max_clients=100)
+        self.update_ids = itertools.count(1)
+        self.waiting = {}
+        self.process = None
+    
+    def on_reply(self, method: str, chat_id: int, message: dict) -> None:
+        future = self.waiting.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+    
+    async def start(self, workdir: str) -> None:
+        """Start the bot and wait until it can receive updates."""
+        self.api.start()
+        env = dict(
+            os.environ,
+            BOT_TOKEN="123:bench",
+            BOT_API_URL=self.api.base_url,
+            CONCURRENT_UPDATES=str(self.concurrent_updates),
+            PERSISTENCE_FLUSH_INTERVAL="5",
+            METRICS_PORT=str(self.metrics_port),
+            # Telegram's flood limits do not apply to the fake Bot API
+            RATE_LIMIT_PER_SECOND="0",
+        )
+        env.update(self.env)
+        if self.mode == "webhook":
+            env.update(
+                WEBHOOK_URL=f"http://127.0.0.1:{self.webhook_port}",
+                WEBHOOK_LISTEN="127.0.0.1",
+                WEBHOOK_PORT=str(self.webhook_port),
+                WEBHOOK_SECRET=WEBHOOK_SECRET,
+            )
+        self.log = open(os.path.join(workdir, "bot.log"), "w")
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, self.script, cwd=workdir, env=env,
+            stdout=asyncio.subprocess.DEVNULL, stderr=self.log
+        )
+        
+        deadline = time.monotonic() + START_TIMEOUT
+        while not await self.ready():
+            if self.process.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Bot did not start, see {self.log.name}")
+            await asyncio.sleep(0.05)
+    
+    async def ready(self) -> bool:
+        if self.mode == "polling":
+            return self.api.calls.get("getUpdates", 0) > 0
+        if self.api.webhook_url is None:
+            return False
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", self.webhook_port)
+        except OSError:
+            return False
+        writer.close()
+        return True
+    
+    async def stop(self) -> None:
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(self.process.wait(), 15)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        self.api.stop()
+        self.log.close()
+    
+    async def post_update(self, update: dict, secret: str = WEBHOOK_SECRET) -> int:
+        """POST an update to the webhook server and return the HTTP status."""
+        try:
+            response = await self.http.fetch(
+                self.api.webhook_url,
+                method="POST",
+                body=json.dumps(update),
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+            )
+        except HTTPClientError as error:
+            return error.code
+        return response.code
+    
+    async def send(self, user_id: int, text: str) -> float:
+        """Send a message as a user and return the seconds until the bot replied."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[user_id] = future
+        update = make_message_update(next(self.update_ids), user_id, text)
+        
+        started = time.perf_counter()
+        if self.mode == "polling":
+            self.api.push_update(update)
+        else:
+            status = await self.post_update(update)
+            if status != 200:
+                raise RuntimeError(f"Webhook answered {status}")
+        return await asyncio.wait_for(future, 30) - started
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    """Benchmark one serving mode and return its results."""
+    harness = Harness(mode, args.concurrent_updates)
+    with tempfile.TemporaryDirectory() as workdir:
+        await harness.start(workdir)
+        try:
+            if mode == "webhook":
+                status = await harness.post_update(make_message_update(0, 1, "/start"), secret="wrong")
+                print(f"webhook: update with a wrong secret token answered HTTP {status}")
+            
+            users = range(1, args.users + 1)
+            # Warm-up: registers the users and restores their (empty) persisted data
+            await asyncio.gather(*(harness.send(user_id, args.text) for user_id in users))
+            
+            latencies = []
+            
+            async def virtual_user(user_id: int) -> None:
+                for _ in range(args.messages):
+                    latencies.append(await harness.send(user_id, args.text))
+            
+            started = time.perf_counter()
+            await asyncio.gather(*(virtual_user(user_id) for user_id in users))
+            elapsed = time.perf_counter() - started
+        finally:
+            await harness.stop()
+    
+    return {
+        "mode": mode,
+        "updates": len(latencies),
+        "seconds": elapsed,
+        "updates_per_second": len(latencies) / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    modes = ["polling", "webhook"] if args.mode == "both" else [args.mode]
+    print(f"{args.users} users x {args.messages} messages of {args.text!r}, "
+          f"concurrent updates: {args.concurrent_updates}")
+    for mode in modes:
+        result = await run_mode(mode, args)
+        print(
+            f"{result['mode']:>8}: {result['updates']} updates in {result['seconds']:.2f} s "
+            f"({result['updates_per_second']:.0f}/s), latency mean {result['mean_ms']:.1f} ms, "
+            f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--text", default="/start")
+    parser.add_argument("--concurrent-updates", type=int, default=1)
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
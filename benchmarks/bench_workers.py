@@ -0,0 +1,89 @@
+"""Benchmark throughput of workers.py with 1 to N worker processes.
+
+Runs workers.py against the fake Bot API with the scripted virtual users of bench_load.py,
+once per number of workers, and reports completed steps per second and step latency. With
+a single worker all handlers share one core, like bot.py; more workers can use more cores
+as long as the front process keeps up. The speedup is bounded by the number of cores.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--users 200] [--duration 20]
+        [--think 0.2] [--mode polling] [--api-latency 0]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+from bench_load import STEP_TIMEOUT, LoadHarness, StageStats, VirtualUser, seed_database  # noqa: E402
+
+WORKERS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workers.py")
+# seed_database points database.DATABASE_NAME at the seeded file; every run seeds a new one
+DATABASE_FILE = db.DATABASE_NAME
+
+
+async def run_workers(workers: int, args: argparse.Namespace) -> dict:
+    harness = LoadHarness(
+        args.mode, args.concurrent_updates, args.api_latency,
+        script=WORKERS_PATH, env={"WORKERS": str(workers), "METRICS_PORT": "0"}
+    )
+    rng = random.Random(args.seed)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_database(os.path.join(workdir, DATABASE_FILE), args.users, args.words)
+        await harness.start(workdir)
+        stop = asyncio.Event()
+        users = [VirtualUser(harness, user_id, args.think, random.Random(rng.random()))
+                 for user_id in range(1, args.users + 1)]
+        tasks = [asyncio.create_task(user.run(stop)) for user in users]
+        try:
+            await asyncio.sleep(args.warmup)
+            harness.stats = StageStats()
+            started = time.perf_counter()
+            await asyncio.sleep(args.duration)
+            result = harness.stats.summary(time.perf_counter() - started)
+        finally:
+            stop.set()
+            await asyncio.wait(tasks, timeout=STEP_TIMEOUT)
+            for task in tasks:
+                task.cancel()
+            await harness.stop()
+    
+    result["workers"] = workers
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per run")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring")
+    parser.add_argument("--think", type=float, default=0.2, help="mean pause between steps of a user")
+    parser.add_argument("--words", type=int, default=30, help="words seeded per user")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--concurrent-updates", type=int, default=16, help="per worker")
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    print(f"{args.users} users, think {args.think} s, {os.cpu_count()} CPU cores")
+    baseline = None
+    for workers in args.workers:
+        result = asyncio.run(run_workers(workers, args))
+        baseline = baseline or result["steps_per_second"]
+        print(f"{workers:>3} workers: {result['steps_per_second']:7.1f} steps/s "
+              f"({result['steps_per_second'] / baseline:.1f}x), p50 {result['p50_ms']:7.1f} ms, "
+              f"p95 {result['p95_ms']:7.1f} ms, p99 {result['p99_ms']:7.1f} ms, timeouts {result['timeouts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Minimal stand-in for the Telegram Bot API, used to benchmark the bot locally.
+
+Implements just enough of the API for the bot to start, receive updates by long polling
+(getUpdates) or webhook (setWebhook), send and edit messages (sendMessage, editMessageText)
+and answer button presses (answerCallbackQuery). Every reply is reported to a callback
+with the resulting message, so a harness can measure the time from an update to the bot's answer
+and press the buttons it sent.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+import tornado.netutil
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+# Methods that answer a user; the sent or edited message is reported to on_reply
+REPLY_METHODS = ("sendMessage", "editMessageText", "editMessageReplyMarkup")
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Build the JSON of an update with a private text message."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, user_id: int, message: dict, data: str) -> dict:
+    """Build the JSON of an update with a press of an inline button under a bot message."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    callback_query = {
+        "id": str(update_id),
+        "from": user,
+        "message": message,
+        "chat_instance": str(user_id),
+        "data": data,
+    }
+    return {"update_id": update_id, "callback_query": callback_query}
+
+
+def inline_buttons(message: dict) -> list:
+    """Get the callback data of all inline buttons of a message."""
+    keyboard = message.get("reply_markup", {}).get("inline_keyboard", [])
+    return [button["callback_data"] for row in keyboard for button in row if "callback_data" in button]
+
+
+class FakeBotApi:
+    """Bot API server on localhost. Call start() inside a running event loop."""
+    
+    def __init__(self, on_reply=None, latency: float = 0.0):
+        # on_reply(method, chat_id, message) is called with the sent or edited message
+        self.on_reply = on_reply
+        # Seconds added to every call but getUpdates, like the round trip to Telegram
+        self.latency = latency
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.calls = {}
+        self._updates = []
+        self._updates_ready = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._server = None
+        self.port = None
+    
+    def start(self, port: int = 0) -> int:
+        """Start listening and return the port. Port 0 picks a free one."""
+        app = tornado.web.Application([(r"/bot[^/]+/(\w+)", _MethodHandler, {"api": self})])
+        self._server = HTTPServer(app)
+        sockets = tornado.netutil.bind_sockets(port, "127.0.0.1")
+        self._server.add_sockets(sockets)
+        self.port = sockets[0].getsockname()[1]
+        return self.port
+    
+    def stop(self) -> None:
+        """Stop listening and answer pending long polls."""
+        if self._server is not None:
+            self._server.stop()
+        self._updates_ready.set()
+    
+    @property
+    def base_url(self) -> str:
+        """Value for the BOT_API_URL setting of the bot."""
+        return f"http://127.0.0.1:{self.port}/bot"
+    
+    def push_update(self, update: dict) -> None:
+        """Queue an update for the next getUpdates call."""
+        self._updates.append(update)
+        self._updates_ready.set()
+    
+    async def get_updates(self, offset: int, limit: int, timeout: float) -> list:
+        # Updates below offset were confirmed by the bot
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+    
+    def message(self, chat_id, text: str, message_id=None, reply_markup=None) -> dict:
+        message = {
+            "message_id": int(message_id) if message_id else next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        # Sent messages only carry inline keyboards, reply keyboards stay with the client
+        markup = json.loads(reply_markup) if reply_markup else {}
+        if "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+    
+    async def call(self, method: str, params: dict):
+        """Answer one Bot API call."""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency and method != "getUpdates":
+            await asyncio.sleep(self.latency)
+        
+        if method in REPLY_METHODS:
+            # An edit keeps the message ID and replaces the keyboard
+            result = self.message(
+                params["chat_id"], params.get("text", ""), params.get("message_id"), params.get("reply_markup")
+            )
+            if self.on_reply is not None:
+                self.on_reply(method, int(params["chat_id"]), result)
+            return result
+        
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self.get_updates(
+                int(params.get("offset", 0)), int(params.get("limit", 100)), float(params.get("timeout", 0))
+            )
+        if method == "setWebhook":
+            self.webhook_url = params["url"]
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        # answerCallbackQuery and the other calls the bot makes just succeed
+        return True
+
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotApi) -> None:
+        self.api = api
+    
+    async def post(self, method: str) -> None:
+        params = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        result = await self.api.call(method, params)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": result}))
@@ -1,20 +1,65 @@
 """Telegram bot for English vocabulary learning."""
 
+import asyncio
+import functools
 import random
 import logging
-from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+import tempfile
+import time
+from typing import Optional
+from telegram import (
+    Update,
+    ReplyKeyboardMarkup,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     ConversationHandler,
     filters,
     ContextTypes,
+    PersistenceInput,
 )
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN,
+    BOT_API_URL,
+    CONCURRENT_UPDATES,
+    MAX_PENDING_UPDATES,
+    MAX_PENDING_UPDATES_PER_USER,
+    RATE_LIMIT_PER_SECOND,
+    RATE_LIMIT_PER_CHAT,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_MAX_QUEUE,
+    PERSISTENCE_FLUSH_INTERVAL,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    METRICS_PORT,
+    METRICS_LISTEN,
+)
 import database as db
+import async_database as adb
+from persistence import SQLitePersistence
+import exporter
+import importer
+import metrics
+import page_cache
+import quiz
+import search
+import similarity
+import srs
+from rate_limiter import PRIORITY_BROWSING, PRIORITY_QUIZ, PriorityRateLimiter, priority
+from update_processor import UserOrderedUpdateProcessor
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -26,6 +71,8 @@ MAIN_MENU_KEYBOARD = ReplyKeyboardMarkup(
     [
         ["📚 Test All Words"],
         ["📝 Test Last 30 Words"],
+        ["🎯 Hard Test All Words"],
+        ["🔁 Review Due Words"],
         ["➕ Add Word"],
         ["👀 View Words"],
         ["🗑 Delete Word"]
@@ -38,11 +85,31 @@ QUIZ_ANSWER = range(4, 5)[0]
 DELETE_WORDS_PER_PAGE = 5
 VIEW_WORDS_PER_PAGE = 10
 
+# Seconds between progress updates of a running import
+IMPORT_PROGRESS_INTERVAL = 1.0
+
+# Words listed in the reply to /find
+FIND_RESULTS_SHOWN = 20
+# Seconds Telegram may reuse the answer to an inline query of the same user
+INLINE_CACHE_SECONDS = 30
+
+# Update types the handlers below react to; Telegram does not send the others
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+# Fetched updates waiting for the update processor; when full, polling pauses
+UPDATE_QUEUE_SIZE = 100
+# Seconds between refreshes of the gauges computed from event loop state
+GAUGE_REFRESH_INTERVAL = 5.0
+
+# Gauge values computed on the event loop by refresh_loop_gauges, so the metrics server
+# thread never iterates dicts the handlers are changing; values are replaced, never mutated
+_loop_gauges = {"active_quizzes": 0, "open_conversations": {}}
+_gauge_task: Optional[asyncio.Task] = None
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command."""
     user = update.effective_user
-    is_new = db.register_user(user.id, user.username, user.first_name)
+    is_new = await adb.register_user(user.id, user.username, user.first_name)
     
     if is_new:
         welcome_text = (
@@ -196,7 +263,14 @@ async def add_word2(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     word2 = context.user_data["word2"]
     
     if word_type == "translation":
-        db.add_translation_word(update.effective_user.id, word1, word2)
+        if await adb.add_translation_word(update.effective_user.id, word1, word2) is None:
+            await update.message.reply_text(
+                f"☑️ This word is already in your list.\n\n"
+                f"🔤 {word1} — {word2}",
+                reply_markup=MAIN_MENU_KEYBOARD
+            )
+            return ConversationHandler.END
+        quiz.invalidate_word_table(update.effective_user.id)
         
         await update.message.reply_text(
             f"✅ Word added!\n\n"
@@ -205,7 +279,14 @@ async def add_word2(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
     else:
         form_pair = context.user_data.get("form_pair")
-        db.add_irregular_verb(update.effective_user.id, word1, word2, form_pair)
+        if await adb.add_irregular_verb(update.effective_user.id, word1, word2, form_pair) is None:
+            await update.message.reply_text(
+                f"☑️ This verb is already in your list.\n\n"
+                f"📖 {word1} → {word2}",
+                reply_markup=MAIN_MENU_KEYBOARD
+            )
+            return ConversationHandler.END
+        quiz.invalidate_word_table(update.effective_user.id)
         
         if form_pair == "1-2":
             form_label = "Infinitive → Past Simple"
@@ -231,8 +312,109 @@ async def cancel_adding(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     return ConversationHandler.END
 
 
-def generate_quiz_question(word: dict, all_words: list) -> dict:
-    """Generate a quiz question with options."""
+async def import_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /import command: explain how to import words from a file."""
+    await update.message.reply_text(
+        "📥 Send a .csv, .tsv or .txt file to add many words at once.\n\n"
+        "One word per line, columns separated by a tab, semicolon or comma:\n"
+        "• translation: english;russian\n"
+        "• irregular verb: go;went;1-2 or went;gone;2-3\n\n"
+        "A header line is skipped.",
+        reply_markup=MAIN_MENU_KEYBOARD
+    )
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import words from an uploaded CSV/TSV document, reporting progress in one message."""
+    user_id = update.effective_user.id
+    document = update.message.document
+    
+    if document.file_size and document.file_size > importer.MAX_FILE_SIZE:
+        await update.message.reply_text(
+            "❌ The file is too large. Split it into files under 20 MB.",
+            reply_markup=MAIN_MENU_KEYBOARD
+        )
+        return
+    
+    progress = await update.message.reply_text("📥 Importing words...")
+    telegram_file = await document.get_file()
+    
+    with tempfile.TemporaryFile() as raw:
+        await telegram_file.download_to_memory(raw)
+        raw.seek(0)
+        
+        job = await adb.run(importer.ImportJob, user_id, raw)
+        failed = False
+        last_progress = time.monotonic()
+        try:
+            while await adb.run(job.import_batch):
+                if time.monotonic() - last_progress >= IMPORT_PROGRESS_INTERVAL:
+                    await progress.edit_text(f"📥 Importing words... {job.imported} added")
+                    last_progress = time.monotonic()
+        except Exception:
+            # The batches committed so far stay imported
+            logger.exception("Import for user %s failed after %d words", user_id, job.imported)
+            failed = True
+    
+    if job.imported:
+        quiz.invalidate_word_table(user_id)
+    
+    if not failed and not job.imported and not job.skipped and not job.duplicates:
+        await progress.edit_text("📭 The file has no words to import. See /import for the format.")
+        return
+    
+    lines = [
+        "⚠️ Import stopped by an error.\n" if failed else "✅ Import finished!\n",
+        f"Added: {job.imported} ({job.translations} translations, {job.verbs} irregular verbs)",
+    ]
+    if job.duplicates:
+        lines.append(f"Already in your list: {job.duplicates}")
+    if job.skipped:
+        lines.append(f"Skipped: {job.skipped} invalid lines")
+        lines.extend(f"• line {line_number}: {reason}" for line_number, reason in job.errors)
+    if job.stopped:
+        line_number, reason = job.stopped
+        lines.append(f"⚠️ Stopped at line {line_number}: {reason}. The lines after it were not imported.")
+    
+    await progress.edit_text("\n".join(lines))
+
+
+async def export_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /export [anki]: send the user's words as a file built in the background."""
+    export_format = "anki" if context.args and context.args[0].lower() == "anki" else "csv"
+    
+    await update.message.reply_text("📤 Preparing your words file...", reply_markup=MAIN_MENU_KEYBOARD)
+    context.application.create_task(
+        send_export(context, update.effective_chat.id, update.effective_user.id, export_format),
+        update=update
+    )
+
+
+async def send_export(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, export_format: str) -> None:
+    """Build an export on the database thread pool and send it as a document."""
+    buffer, count = await adb.run(exporter.export_words, user_id, export_format)
+    
+    with buffer:
+        if count == 0:
+            await context.bot.send_message(chat_id, "You don't have any words added yet! 📭")
+            return
+        
+        if export_format == "anki":
+            filename = "eng-diary-anki.txt"
+            caption = f"📤 {count} words. In Anki: File → Import and choose this file."
+        else:
+            filename = "eng-diary-words.csv"
+            caption = f"📤 {count} words. You can import this file back by sending it to the bot."
+        
+        await context.bot.send_document(chat_id, document=buffer, filename=filename, caption=caption)
+
+
+def generate_quiz_question(
+    word: dict,
+    distractors: quiz.DistractorIndex,
+    hard_index: Optional[similarity.UserSimilarityIndex] = None
+) -> dict:
+    """Generate a quiz question with options. With hard_index, wrong answers look like the correct one."""
     word_type = word["word_type"]
     
     if word_type == "translation":
@@ -241,24 +423,25 @@ def generate_quiz_question(word: dict, all_words: list) -> dict:
         if ask_english:
             question = f"What is the translation of: **{word['word1']}**?"
             correct_answer = word["word2"]
-            wrong_pool = [w["word2"] for w in all_words if w["id"] != word["id"]]
+            bucket = ("translation", "word2")
         else:
             question = f"What is the translation of: **{word['word2']}**?"
             correct_answer = word["word1"]
-            wrong_pool = [w["word1"] for w in all_words if w["id"] != word["id"]]
+            bucket = ("translation", "word1")
     else:
         form_pair = word.get("word3", "1-2")
         
         if form_pair == "1-2":
             question = f"What is the second form (Past Simple) of: **{word['word1']}**?"
             correct_answer = word["word2"]
-            wrong_pool = [w["word2"] for w in all_words if w["id"] != word["id"] and w.get("word3") == "1-2"]
+            bucket = ("irregular", "1-2")
         else:
             question = f"What is the third form (Past Participle) of: **{word['word1']}**?"
             correct_answer = word["word2"]
-            wrong_pool = [w["word2"] for w in all_words if w["id"] != word["id"] and w.get("word3") == "2-3"]
+            bucket = ("irregular", "2-3")
     
-    wrong_answers = random.sample(wrong_pool, min(3, len(wrong_pool)))
+    wrong_answers = hard_index.similar(bucket, correct_answer) if hard_index else []
+    wrong_answers += distractors.sample(bucket, correct_answer, 3 - len(wrong_answers), exclude=wrong_answers)
     
     all_answers = [correct_answer] + wrong_answers
     random.shuffle(all_answers)
@@ -271,16 +454,15 @@ def generate_quiz_question(word: dict, all_words: list) -> dict:
     }
 
 
-async def start_quiz_all(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@priority(PRIORITY_QUIZ)
+async def start_quiz_all(update: Update, context: ContextTypes.DEFAULT_TYPE, hard: bool = False) -> int:
     """Start quiz with all words."""
     user_id = update.effective_user.id
     
-    translation_words = db.get_all_words(user_id, "translation")
-    irregular_words = db.get_all_words(user_id, "irregular")
-    
-    all_words = translation_words + irregular_words
+    # Only the IDs are read here; rows are fetched a few questions ahead
+    word_ids = await adb.get_word_ids(user_id)
     
-    if not all_words:
+    if not word_ids:
         await update.message.reply_text(
             "You don't have any words added yet! 📭\n"
             "First add some words through the menu.",
@@ -288,24 +470,24 @@ async def start_quiz_all(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return ConversationHandler.END
     
-    random.shuffle(all_words)
-    
-    context.user_data["quiz_words"] = all_words
-    context.user_data["quiz_translation_pool"] = translation_words
-    context.user_data["quiz_irregular_pool"] = irregular_words
-    context.user_data["quiz_index"] = 0
-    context.user_data["quiz_score"] = 0
-    context.user_data["quiz_total"] = len(all_words)
-    
-    return await send_quiz_question(update, context)
+    session = quiz.QuizSession(quiz.get_word_table(user_id), word_ids, hard=hard)
+    return await begin_quiz(update, context, session)
 
 
+@priority(PRIORITY_QUIZ)
+async def start_quiz_hard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Start quiz with all words and look-alike wrong answers."""
+    await adb.run(similarity.load_index, update.effective_user.id)
+    return await start_quiz_all(update, context, hard=True)
+
+
+@priority(PRIORITY_QUIZ)
 async def start_quiz_last30(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start quiz with last 30 words."""
     user_id = update.effective_user.id
     
-    translation_words = db.get_last_words(user_id, 30, "translation")
-    irregular_words = db.get_last_words(user_id, 30, "irregular")
+    translation_words = await adb.get_last_words(user_id, 30, "translation")
+    irregular_words = await adb.get_last_words(user_id, 30, "irregular")
     
     all_last_words = translation_words + irregular_words
     all_last_words.sort(key=lambda x: x["created_at"], reverse=True)
@@ -319,38 +501,108 @@ async def start_quiz_last30(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ConversationHandler.END
     
-    random.shuffle(all_last_words)
+    # Wrong answers come from the same 30 words, so this table is not shared
+    table = quiz.WordTable(user_id, all_last_words)
+    word_ids = [word["id"] for word in all_last_words]
     
-    translation_pool = [w for w in all_last_words if w["word_type"] == "translation"]
-    irregular_pool = [w for w in all_last_words if w["word_type"] == "irregular"]
+    return await begin_quiz(update, context, quiz.QuizSession(table, word_ids))
+
+
+@priority(PRIORITY_QUIZ)
+async def start_quiz_review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Start quiz with the words due for spaced repetition review."""
+    user_id = update.effective_user.id
     
-    context.user_data["quiz_words"] = all_last_words
-    context.user_data["quiz_translation_pool"] = translation_pool
-    context.user_data["quiz_irregular_pool"] = irregular_pool
-    context.user_data["quiz_index"] = 0
-    context.user_data["quiz_score"] = 0
-    context.user_data["quiz_total"] = len(all_last_words)
+    due_words = await adb.get_due_words(user_id, 30)
+    
+    if not due_words:
+        next_due_at = await adb.get_next_due_at(user_id)
+        if next_due_at is None:
+            text = "You don't have any words added yet! 📭\nFirst add some words through the menu."
+        else:
+            text = f"Nothing to review right now! 🎉\nNext review: {next_due_at[:16].replace('T', ' ')}"
+        await update.message.reply_text(text, reply_markup=MAIN_MENU_KEYBOARD)
+        return ConversationHandler.END
+    
+    table = quiz.get_word_table(user_id)
+    table.add_rows(due_words)
+    word_ids = [word["id"] for word in due_words]
+    
+    # A few due words would give too few wrong answers; take them from every word
+    return await begin_quiz(update, context, quiz.QuizSession(table, word_ids, deck_answers=False))
+
+
+async def load_words(user_id: int, table: quiz.WordTable, word_ids: list) -> None:
+    """Fetch the rows a word table is missing."""
+    missing = table.missing(word_ids)
+    if missing:
+        table.add_rows(await adb.get_words_by_ids(user_id, missing))
+
+
+async def build_distractors(user_id: int, session: quiz.QuizSession) -> None:
+    """Build the wrong answer index of a session so that each question only samples from it.
+    
+    Large decks use a random sample instead of every word. An index missing answers is
+    topped up from the whole vocabulary by send_quiz_question.
+    """
+    sample_ids = session.sample_ids()
+    await load_words(user_id, session.table, sample_ids)
+    session.distractors = quiz.DistractorIndex(
+        filter(None, map(session.table.get, sample_ids)),
+        complete=session.deck_answers and len(sample_ids) == session.total
+    )
+
+
+async def begin_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, session: quiz.QuizSession) -> int:
+    """Store a new quiz session for the user and send its first question."""
+    user_id = update.effective_user.id
+    
+    await build_distractors(user_id, session)
+    context.user_data["quiz"] = session
+    
+    logger.info(
+        "Quiz started for user %s: %d words, session %d bytes, word table %d bytes",
+        user_id, session.total, session.memory_usage(), session.table.memory_usage()
+    )
     
     return await send_quiz_question(update, context)
 
 
 async def send_quiz_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Send the current quiz question."""
-    quiz_words = context.user_data.get("quiz_words", [])
-    quiz_index = context.user_data.get("quiz_index", 0)
+    session = context.user_data.get("quiz")
     
-    if quiz_index >= len(quiz_words):
+    if session is None or session.finished:
         return await end_quiz(update, context)
     
-    current_word = quiz_words[quiz_index]
-    
-    if current_word["word_type"] == "translation":
-        pool = context.user_data["quiz_translation_pool"]
-    else:
-        pool = context.user_data["quiz_irregular_pool"]
-    
-    question_data = generate_quiz_question(current_word, pool)
-    context.user_data["current_question"] = question_data
+    user_id = update.effective_user.id
+    if session.distractors is None:
+        # Sessions restored after a restart do not keep their indexes
+        await build_distractors(user_id, session)
+        if session.hard:
+            await adb.run(similarity.load_index, user_id)
+    await load_words(user_id, session.table, session.upcoming_ids())
+    loaded_until = session.index + quiz.PREFETCH_ROWS
+    current_word = session.current_word()
+    
+    while current_word is None:
+        # The word was deleted after the quiz started
+        session.index += 1
+        if session.finished:
+            return await end_quiz(update, context)
+        if session.index >= loaded_until:
+            await load_words(user_id, session.table, session.upcoming_ids())
+            loaded_until = session.index + quiz.PREFETCH_ROWS
+        current_word = session.current_word()
+    
+    if session.distractors.needs_top_up(current_word):
+        rows = await adb.get_random_words(user_id, current_word["word_type"], current_word["word3"])
+        session.distractors.top_up(current_word, rows)
+    
+    hard_index = similarity.get_index(user_id) if session.hard else None
+    
+    question_data = generate_quiz_question(current_word, session.distractors, hard_index)
+    session.current_question = question_data
     
     keyboard = []
     for i, option in enumerate(question_data["options"]):
@@ -358,7 +610,7 @@ async def send_quiz_question(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     keyboard.append([InlineKeyboardButton("❌ Finish Test", callback_data="quit_quiz")])
     
-    progress = f"Question {quiz_index + 1}/{context.user_data['quiz_total']}"
+    progress = f"Question {session.index + 1}/{session.total}"
     message_text = f"📊 {progress}\n\n{question_data['question']}"
     
     if update.callback_query:
@@ -377,6 +629,7 @@ async def send_quiz_question(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return QUIZ_ANSWER
 
 
+@priority(PRIORITY_QUIZ)
 async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle quiz answer."""
     query = update.callback_query
@@ -386,25 +639,35 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await end_quiz(update, context, quit_early=True)
     
     answer_index = int(query.data.replace("answer_", ""))
-    question_data = context.user_data.get("current_question")
+    session = context.user_data.get("quiz")
     
-    if not question_data:
+    if session is None:
         await query.edit_message_text(
             "An error occurred. Start the test again.",
             reply_markup=None
         )
         return ConversationHandler.END
     
+    question_data = session.current_question
+    if question_data is None:
+        # A second tap, or a tap on the buttons of an answered question
+        return QUIZ_ANSWER
+    
     selected_answer = question_data["options"][answer_index]
     correct_answer = question_data["correct_answer"]
     
     if selected_answer == correct_answer:
-        context.user_data["quiz_score"] = context.user_data.get("quiz_score", 0) + 1
+        session.score += 1
         result_text = "✅ Correct!"
+        quality = srs.QUALITY_CORRECT
     else:
         result_text = f"❌ Incorrect!\nCorrect answer: {correct_answer}"
+        quality = srs.QUALITY_WRONG
+    
+    await adb.record_review(update.effective_user.id, question_data["word_id"], quality)
     
-    context.user_data["quiz_index"] = context.user_data.get("quiz_index", 0) + 1
+    session.index += 1
+    session.current_question = None
     
     keyboard = [[InlineKeyboardButton("➡️ Next Question", callback_data="next_question")]]
     
@@ -416,25 +679,37 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return QUIZ_ANSWER
 
 
+@priority(PRIORITY_QUIZ)
 async def next_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Move to the next question."""
     query = update.callback_query
     await query.answer()
     
-    quiz_index = context.user_data.get("quiz_index", 0)
-    quiz_words = context.user_data.get("quiz_words", [])
+    session = context.user_data.get("quiz")
     
-    if quiz_index >= len(quiz_words):
+    if session is None or session.finished:
         return await end_quiz(update, context)
     
     return await send_quiz_question(update, context)
 
 
+def leaving_quiz(callback):
+    """Wrap a fallback of the quiz conversation so that the session is dropped when it ends the quiz."""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        state = await callback(update, context)
+        if state == ConversationHandler.END:
+            context.user_data.pop("quiz", None)
+        return state
+    return wrapper
+
+
 async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quit_early: bool = False) -> int:
     """End the quiz and show results."""
-    score = context.user_data.get("quiz_score", 0)
-    total = context.user_data.get("quiz_total", 0)
-    answered = context.user_data.get("quiz_index", 0)
+    session = context.user_data.pop("quiz", None)
+    score = session.score if session else 0
+    total = session.total if session else 0
+    answered = session.index if session else 0
     
     if total > 0:
         percentage = (score / answered * 100) if answered > 0 else 0
@@ -463,14 +738,6 @@ async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quit_earl
             f"📈 Correct percentage: {percentage:.1f}%"
         )
     
-    context.user_data.pop("quiz_words", None)
-    context.user_data.pop("quiz_translation_pool", None)
-    context.user_data.pop("quiz_irregular_pool", None)
-    context.user_data.pop("quiz_index", None)
-    context.user_data.pop("quiz_score", None)
-    context.user_data.pop("quiz_total", None)
-    context.user_data.pop("current_question", None)
-    
     if update.callback_query:
         await update.callback_query.edit_message_text(result_text)
         await update.callback_query.message.reply_text(
@@ -486,11 +753,103 @@ async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quit_earl
     return ConversationHandler.END
 
 
+PAGE_DIRECTIONS = ("first", "prev", "next", "last")
+
+
 def get_total_pages(total_count: int) -> int:
     """Calculate total number of pages for pagination."""
     return (total_count + DELETE_WORDS_PER_PAGE - 1) // DELETE_WORDS_PER_PAGE
 
 
+def page_callback(prefix: str, direction: str, page: int, word: dict) -> str:
+    """Build callback data for a page button, carrying the (created_at, id) cursor of a word."""
+    return f"{prefix}_{direction}_{page}_{word['created_at']}_{word['id']}"
+
+
+def is_page_callback(data: str) -> bool:
+    """Check whether callback data is a pagination button."""
+    parts = data.split("_")
+    return len(parts) > 1 and parts[1] in PAGE_DIRECTIONS
+
+
+def is_legacy_page_callback(data: str) -> bool:
+    """Check whether callback data is a page button sent before keyset pagination, like view_page_3."""
+    parts = data.split("_")
+    return len(parts) == 3 and parts[1] == "page" and parts[2].isdigit()
+
+
+async def fetch_words_page(user_id: int, data: str, per_page: int, total_count: int) -> tuple:
+    """Fetch the page a pagination button points to. Returns (words, page)."""
+    parts = data.split("_")
+    direction = parts[1]
+    total_pages = (total_count + per_page - 1) // per_page
+    
+    if direction in ("next", "prev"):
+        page = int(parts[2])
+        position = (parts[3], int(parts[4]))
+        words = await adb.get_words_page(user_id, per_page, direction, position)
+    elif direction == "last":
+        page = max(total_pages - 1, 0)
+        limit = total_count - page * per_page
+        words = await adb.get_words_page(user_id, limit, "last")
+    else:
+        page = 0
+        words = await adb.get_words_page(user_id, per_page, "first")
+    
+    return words, page
+
+
+async def get_word_count_cached(user_id: int) -> int:
+    """Get the number of words of a user, from the page cache if possible."""
+    version = db.get_vocab_version(user_id)
+    total_count = page_cache.get(user_id, version, "count")
+    
+    if total_count is None:
+        total_count = await adb.get_word_count(user_id)
+        page_cache.put(user_id, version, "count", total_count)
+    
+    return total_count
+
+
+async def get_rendered_page(user_id: int, data: str, per_page: int, render) -> Optional[tuple]:
+    """Get the (text, keyboard) of the page a pagination button points to.
+    
+    Pages are rendered by render(words, page, total_count) and kept in the page cache
+    until the user's words change. Returns None if the user has no words or the page is empty.
+    """
+    version = db.get_vocab_version(user_id)
+    rendered = page_cache.get(user_id, version, data)
+    if rendered is not None:
+        return rendered
+    
+    total_count = await get_word_count_cached(user_id)
+    if total_count == 0:
+        return None
+    
+    words, page = await fetch_words_page(user_id, data, per_page, total_count)
+    if not words:
+        return None
+    
+    rendered = render(words, page, total_count)
+    page_cache.put(user_id, version, data, rendered)
+    return rendered
+
+
+def build_page_nav_buttons(prefix: str, words: list, page: int, total_pages: int) -> list:
+    """Build the First/Back/Forward/Last row for a page of words."""
+    nav_buttons = []
+    
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⏮", callback_data=f"{prefix}_first"))
+        nav_buttons.append(InlineKeyboardButton("⬅️ Back", callback_data=page_callback(prefix, "prev", page - 1, words[0])))
+    
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton("Forward ➡️", callback_data=page_callback(prefix, "next", page + 1, words[-1])))
+        nav_buttons.append(InlineKeyboardButton("⏭", callback_data=f"{prefix}_last"))
+    
+    return nav_buttons
+
+
 def build_delete_words_keyboard(words: list, page: int, total_count: int) -> InlineKeyboardMarkup:
     """Build inline keyboard for word deletion with pagination."""
     keyboard = []
@@ -508,14 +867,7 @@ def build_delete_words_keyboard(words: list, page: int, total_count: int) -> Inl
         keyboard.append([InlineKeyboardButton(label, callback_data=f"del_word_{word['id']}")])
     
     # Pagination buttons
-    nav_buttons = []
-    total_pages = get_total_pages(total_count)
-    
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Back", callback_data=f"del_page_{page - 1}"))
-    
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Forward ➡️", callback_data=f"del_page_{page + 1}"))
+    nav_buttons = build_page_nav_buttons("del", words, page, get_total_pages(total_count))
     
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -525,31 +877,33 @@ def build_delete_words_keyboard(words: list, page: int, total_count: int) -> Inl
     return InlineKeyboardMarkup(keyboard)
 
 
+def render_delete_page(words: list, page: int, total_count: int) -> tuple:
+    """Render the text and keyboard of a page of the word deletion list."""
+    total_pages = get_total_pages(total_count)
+    page_info = f"Page {page + 1}/{total_pages}" if total_pages > 1 else ""
+    keyboard = build_delete_words_keyboard(words, page=page, total_count=total_count)
+    return f"🗑 Choose a word to delete:\n{page_info}", keyboard
+
+
+@priority(PRIORITY_BROWSING)
 async def delete_word_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the word deletion process."""
     user_id = update.effective_user.id
-    total_count = db.get_word_count(user_id)
+    rendered = await get_rendered_page(user_id, "del_first", DELETE_WORDS_PER_PAGE, render_delete_page)
     
-    if total_count == 0:
+    if rendered is None:
         await update.message.reply_text(
             "You don't have any words added yet! 📭",
             reply_markup=MAIN_MENU_KEYBOARD
         )
         return ConversationHandler.END
     
-    words = db.get_words_paginated(user_id, offset=0, limit=DELETE_WORDS_PER_PAGE)
-    keyboard = build_delete_words_keyboard(words, page=0, total_count=total_count)
-    
-    total_pages = get_total_pages(total_count)
-    page_info = f"Page 1/{total_pages}" if total_pages > 1 else ""
-    
-    await update.message.reply_text(
-        f"🗑 Choose a word to delete:\n{page_info}",
-        reply_markup=keyboard
-    )
+    message_text, keyboard = rendered
+    await update.message.reply_text(message_text, reply_markup=keyboard)
     return ConversationHandler.END
 
 
+@priority(PRIORITY_BROWSING)
 async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle delete word callbacks."""
     query = update.callback_query
@@ -562,25 +916,19 @@ async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_T
         await query.edit_message_text("Deletion cancelled.")
         return
     
-    if data.startswith("del_page_"):
-        page = int(data.replace("del_page_", ""))
-        offset = page * DELETE_WORDS_PER_PAGE
-        
-        total_count = db.get_word_count(user_id)
-        words = db.get_words_paginated(user_id, offset=offset, limit=DELETE_WORDS_PER_PAGE)
+    if is_legacy_page_callback(data):
+        # Old buttons carry only a page number, so they open the first page
+        data = "del_first"
+    
+    if is_page_callback(data):
+        rendered = await get_rendered_page(user_id, data, DELETE_WORDS_PER_PAGE, render_delete_page)
         
-        if not words:
+        if rendered is None:
             await query.edit_message_text("Words not found.")
             return
         
-        keyboard = build_delete_words_keyboard(words, page=page, total_count=total_count)
-        total_pages = get_total_pages(total_count)
-        page_info = f"Page {page + 1}/{total_pages}" if total_pages > 1 else ""
-        
-        await query.edit_message_text(
-            f"🗑 Choose a word to delete:\n{page_info}",
-            reply_markup=keyboard
-        )
+        message_text, keyboard = rendered
+        await query.edit_message_text(message_text, reply_markup=keyboard)
         return
     
     if data.startswith("del_word_"):
@@ -602,7 +950,8 @@ async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_T
     if data.startswith("del_confirm_"):
         word_id = int(data.replace("del_confirm_", ""))
         
-        if db.delete_word(user_id, word_id):
+        if await adb.delete_word(user_id, word_id):
+            quiz.invalidate_word_table(user_id)
             await query.edit_message_text("✅ Word deleted!")
         else:
             await query.edit_message_text("❌ Failed to delete word.")
@@ -610,21 +959,21 @@ async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     if data == "del_cancel":
         # Return to word list
-        total_count = db.get_word_count(user_id)
+        rendered = await get_rendered_page(user_id, "del_first", DELETE_WORDS_PER_PAGE, render_delete_page)
         
-        if total_count == 0:
+        if rendered is None:
             await query.edit_message_text("You have no more words to delete! 📭")
             return
         
-        words = db.get_words_paginated(user_id, offset=0, limit=DELETE_WORDS_PER_PAGE)
-        keyboard = build_delete_words_keyboard(words, page=0, total_count=total_count)
-        total_pages = get_total_pages(total_count)
-        page_info = f"Page 1/{total_pages}" if total_pages > 1 else ""
-        
-        await query.edit_message_text(
-            f"🗑 Choose a word to delete:\n{page_info}",
-            reply_markup=keyboard
-        )
+        message_text, keyboard = rendered
+        await query.edit_message_text(message_text, reply_markup=keyboard)
+
+
+def format_word(word: dict) -> str:
+    """Format a word as shown in word lists."""
+    if word["word_type"] == "translation":
+        return f"🔤 {word['word1']} — {word['word2']}"
+    return f"📖 {word['word1']} → {word['word2']}"
 
 
 def get_view_total_pages(total_count: int) -> int:
@@ -637,10 +986,7 @@ def build_view_words_message(words: list, page: int, total_pages: int) -> str:
     lines = []
     start_num = page * VIEW_WORDS_PER_PAGE + 1
     for i, word in enumerate(words, start=start_num):
-        if word["word_type"] == "translation":
-            lines.append(f"{i}. 🔤 {word['word1']} — {word['word2']}")
-        else:
-            lines.append(f"{i}. 📖 {word['word1']} → {word['word2']}")
+        lines.append(f"{i}. {format_word(word)}")
     
     words_text = "\n".join(lines) if lines else "No words"
     page_info = f"\n\n📄 {page + 1}/{total_pages}"
@@ -649,15 +995,9 @@ def build_view_words_message(words: list, page: int, total_pages: int) -> str:
     return f"📚 Your words:\n\n{legend}\n{words_text}{page_info}"
 
 
-def build_view_words_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+def build_view_words_keyboard(words: list, page: int, total_pages: int) -> InlineKeyboardMarkup:
     """Build inline keyboard for viewing words with pagination."""
-    nav_buttons = []
-    
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Back", callback_data=f"view_page_{page - 1}"))
-    
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Forward ➡️", callback_data=f"view_page_{page + 1}"))
+    nav_buttons = build_page_nav_buttons("view", words, page, total_pages)
     
     keyboard = []
     if nav_buttons:
@@ -668,28 +1008,33 @@ def build_view_words_keyboard(page: int, total_pages: int) -> InlineKeyboardMark
     return InlineKeyboardMarkup(keyboard)
 
 
+def render_view_page(words: list, page: int, total_count: int) -> tuple:
+    """Render the text and keyboard of a page of the word list."""
+    total_pages = get_view_total_pages(total_count)
+    message_text = build_view_words_message(words, page=page, total_pages=total_pages)
+    keyboard = build_view_words_keyboard(words, page=page, total_pages=total_pages)
+    return message_text, keyboard
+
+
+@priority(PRIORITY_BROWSING)
 async def view_words_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start viewing words."""
     user_id = update.effective_user.id
-    total_count = db.get_word_count(user_id)
+    rendered = await get_rendered_page(user_id, "view_first", VIEW_WORDS_PER_PAGE, render_view_page)
     
-    if total_count == 0:
+    if rendered is None:
         await update.message.reply_text(
             "You don't have any words added yet! 📭",
             reply_markup=MAIN_MENU_KEYBOARD
         )
         return ConversationHandler.END
     
-    words = db.get_words_paginated(user_id, offset=0, limit=VIEW_WORDS_PER_PAGE)
-    total_pages = get_view_total_pages(total_count)
-    
-    message_text = build_view_words_message(words, page=0, total_pages=total_pages)
-    keyboard = build_view_words_keyboard(page=0, total_pages=total_pages)
-    
+    message_text, keyboard = rendered
     await update.message.reply_text(message_text, reply_markup=keyboard)
     return ConversationHandler.END
 
 
+@priority(PRIORITY_BROWSING)
 async def handle_view_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle view words callbacks."""
     query = update.callback_query
@@ -702,24 +1047,59 @@ async def handle_view_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("Word list closed.")
         return
     
-    if data.startswith("view_page_"):
-        page = int(data.replace("view_page_", ""))
-        offset = page * VIEW_WORDS_PER_PAGE
-        
-        total_count = db.get_word_count(user_id)
-        words = db.get_words_paginated(user_id, offset=offset, limit=VIEW_WORDS_PER_PAGE)
+    if is_legacy_page_callback(data):
+        # Old buttons carry only a page number, so they open the first page
+        data = "view_first"
+    
+    if is_page_callback(data):
+        rendered = await get_rendered_page(user_id, data, VIEW_WORDS_PER_PAGE, render_view_page)
         
-        if not words:
+        if rendered is None:
             await query.edit_message_text("Words not found.")
             return
         
-        total_pages = get_view_total_pages(total_count)
-        message_text = build_view_words_message(words, page=page, total_pages=total_pages)
-        keyboard = build_view_words_keyboard(page=page, total_pages=total_pages)
-        
+        message_text, keyboard = rendered
         await query.edit_message_text(message_text, reply_markup=keyboard)
 
 
+async def find_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /find <text>: list the words starting with the given text."""
+    text = " ".join(context.args)
+    if not search.query_tokens(text):
+        await update.message.reply_text(
+            "🔎 Type the beginning of a word after the command, e.g. /find tak\n"
+            "You can also search in any chat: type @ and the bot's username, then the word.",
+            reply_markup=MAIN_MENU_KEYBOARD
+        )
+        return
+    
+    words = await search.find_words(update.effective_user.id, text)
+    if not words:
+        await update.message.reply_text(f"Nothing found for “{text}”.", reply_markup=MAIN_MENU_KEYBOARD)
+        return
+    
+    lines = [f"🔎 Words for “{text}”:\n"]
+    lines.extend(format_word(word) for word in words[:FIND_RESULTS_SHOWN])
+    if len(words) > FIND_RESULTS_SHOWN:
+        lines.append("\n…and more. Type more letters to narrow the search.")
+    await update.message.reply_text("\n".join(lines), reply_markup=MAIN_MENU_KEYBOARD)
+
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer an inline query with the user's words starting with the typed text."""
+    query = update.inline_query
+    words = await search.find_words(query.from_user.id, query.query)
+    results = [
+        InlineQueryResultArticle(
+            id=str(word["id"]),
+            title=format_word(word),
+            input_message_content=InputTextMessageContent(f"{word['word1']} — {word['word2']}"),
+        )
+        for word in words
+    ]
+    await query.answer(results, cache_time=INLINE_CACHE_SECONDS, is_personal=True)
+
+
 async def handle_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle main menu button presses."""
     text = update.message.text
@@ -728,17 +1108,139 @@ async def handle_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await start_quiz_all(update, context)
     elif text == "📝 Test Last 30 Words":
         await start_quiz_last30(update, context)
+    elif text == "🎯 Hard Test All Words":
+        await start_quiz_hard(update, context)
+    elif text == "🔁 Review Due Words":
+        await start_quiz_review(update, context)
     elif text == "➕ Add Word":
         await add_word_start(update, context)
 
 
-def main() -> None:
-    """Run the bot."""
-    db.init_db()
+async def finish_updates(application: Application) -> None:
+    """Handle the updates still queued while the bot can send replies."""
+    await application.update_processor.drain()
+    logger.info("Update processor stats: %s", application.update_processor.stats())
+
+
+async def refresh_loop_gauges(application: Application) -> None:
+    """Recompute the gauges that read handler state every GAUGE_REFRESH_INTERVAL seconds."""
+    while True:
+        _loop_gauges["active_quizzes"] = sum(1 for data in application.user_data.values() if "quiz" in data)
+        _loop_gauges["open_conversations"] = application.persistence.conversation_counts()
+        await asyncio.sleep(GAUGE_REFRESH_INTERVAL)
+
+
+async def start_gauge_refresh(application: Application) -> None:
+    """Start refreshing the event loop gauges once the application is initialized."""
+    global _gauge_task
+    _gauge_task = asyncio.get_running_loop().create_task(refresh_loop_gauges(application))
+
+
+async def shutdown_db(application: Application) -> None:
+    """Stop the database worker threads and close pooled connections on shutdown."""
+    if _gauge_task is not None:
+        _gauge_task.cancel()
+    writer = adb.get_writer()
+    if writer is not None:
+        await adb.close_writer()
+        logger.info("Group commit stats: %s", writer.stats())
+    adb.shutdown()
+    for stats in db.get_pool_stats():
+        logger.info("Database pool stats: %s", stats)
+    logger.info("Page cache stats: %s", page_cache.get_stats())
+    db.close_pools()
+
+
+def register_gauges(application: Application) -> None:
+    """Expose live quiz, conversation, cache and connection pool state as gauges."""
+    def active_quizzes() -> int:
+        return _loop_gauges["active_quizzes"]
+    
+    def open_conversations() -> dict:
+        return _loop_gauges["open_conversations"]
+    
+    def page_cache_stats() -> dict:
+        stats = page_cache.get_stats()
+        return {key: stats[key] for key in ("hits", "misses", "evictions", "entries", "bytes")}
+    
+    def pool_checkouts() -> dict:
+        return {stats["path"]: stats["checkouts"] for stats in db.get_pool_stats()}
+    
+    def update_queue() -> dict:
+        stats = application.update_processor.stats()
+        return {key: stats[key] for key in ("pending", "active_users", "processed", "dropped", "backpressure_waits")}
+    
+    def group_commit() -> dict:
+        writer = adb.get_writer()
+        return {key: writer.stats()[key] for key in ("writes", "batches", "pending")} if writer else {}
+    
+    def outgoing_requests() -> dict:
+        return application.bot.rate_limiter.stats() if application.bot.rate_limiter else {}
+    
+    metrics.add_gauge("active_quizzes", "Users with a quiz in progress.", active_quizzes)
+    metrics.add_gauge("open_conversations", "Conversations not yet ended, by conversation handler.",
+                      open_conversations, label_name="conversation")
+    metrics.add_gauge("page_cache", "Word page cache counters and size.", page_cache_stats, label_name="stat")
+    metrics.add_gauge("update_queue", "Queued and handled updates of the update processor.", update_queue,
+                      label_name="stat")
+    metrics.add_gauge("group_commit", "Word writes and the transactions that committed them.", group_commit,
+                      label_name="stat")
+    metrics.add_gauge("outgoing_requests", "Queued, sent, coalesced and dropped outgoing messages.",
+                      outgoing_requests, label_name="stat")
+    metrics.add_gauge("search_cache", "Search results answered from the cache or the index.",
+                      search.get_stats, label_name="stat")
+    metrics.add_gauge("db_pool_checkouts", "Connections borrowed from each pool.", pool_checkouts,
+                      label_name="path")
+
+
+def build_application(rate_limit_share: float = 1.0, metrics_port: int = METRICS_PORT,
+                      updater: bool = True) -> Application:
+    """Build the application with all handlers.
+    
+    rate_limit_share is the part of RATE_LIMIT_PER_SECOND this process may use, for when
+    several processes send messages with one token (see workers.py). Without an updater
+    the application only handles updates put into its update queue.
+    """
+    # Quizzes and add-word dialogs survive restarts; the bot does not use chat or bot data
+    persistence = SQLitePersistence(
+        store_data=PersistenceInput(chat_data=False, bot_data=False, callback_data=False),
+        update_interval=PERSISTENCE_FLUSH_INTERVAL
+    )
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Different users are handled in parallel, the updates of one user in order
+    update_processor = UserOrderedUpdateProcessor(
+        max_workers=CONCURRENT_UPDATES,
+        max_pending=MAX_PENDING_UPDATES,
+        max_pending_per_user=MAX_PENDING_UPDATES_PER_USER
+    )
+    
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_URL)
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(update_processor)
+        .persistence(persistence)
+        .post_stop(finish_updates)
+        .post_shutdown(shutdown_db)
+    )
+    if not updater:
+        builder.updater(None)
+    if metrics_port:
+        builder.post_init(start_gauge_refresh)
+    if RATE_LIMIT_PER_SECOND:
+        # Quiz replies go out first, word list page edits are coalesced
+        builder.rate_limiter(PriorityRateLimiter(
+            overall_rate=RATE_LIMIT_PER_SECOND * rate_limit_share,
+            chat_rate=RATE_LIMIT_PER_CHAT,
+            chat_burst=RATE_LIMIT_CHAT_BURST,
+            max_queue=RATE_LIMIT_MAX_QUEUE
+        ))
+    application = builder.build()
     
     add_word_handler = ConversationHandler(
+        name="add_word",
+        persistent=True,
         entry_points=[
             MessageHandler(filters.Regex("^➕ Add Word$"), add_word_start)
         ],
@@ -757,9 +1259,13 @@ def main() -> None:
     )
     
     quiz_handler = ConversationHandler(
+        name="quiz",
+        persistent=True,
         entry_points=[
             MessageHandler(filters.Regex("^📚 Test All Words$"), start_quiz_all),
             MessageHandler(filters.Regex("^📝 Test Last 30 Words$"), start_quiz_last30),
+            MessageHandler(filters.Regex("^🎯 Hard Test All Words$"), start_quiz_hard),
+            MessageHandler(filters.Regex("^🔁 Review Due Words$"), start_quiz_review),
         ],
         states={
             QUIZ_ANSWER: [
@@ -768,14 +1274,26 @@ def main() -> None:
             ],
         },
         fallbacks=[
-            CommandHandler("cancel", cancel_adding),
+            CommandHandler("cancel", leaving_quiz(cancel_adding)),
             CommandHandler("start", start),
-            MessageHandler(filters.Regex("^🗑 Delete Word$"), delete_word_start),
-            MessageHandler(filters.Regex("^👀 View Words$"), view_words_start),
+            MessageHandler(filters.Regex("^🗑 Delete Word$"), leaving_quiz(delete_word_start)),
+            MessageHandler(filters.Regex("^👀 View Words$"), leaving_quiz(view_words_start)),
         ],
     )
     
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("import", import_help))
+    application.add_handler(CommandHandler("export", export_start))
+    application.add_handler(CommandHandler("find", find_start))
+    application.add_handler(InlineQueryHandler(inline_search))
+    # Imports can take a few seconds, so they do not hold up other updates
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv")
+        | filters.Document.FileExtension("tsv")
+        | filters.Document.FileExtension("txt"),
+        import_document,
+        block=False
+    ))
     application.add_handler(add_word_handler)
     application.add_handler(quiz_handler)
     application.add_handler(MessageHandler(filters.Regex("^🗑 Delete Word$"), delete_word_start))
@@ -783,8 +1301,38 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.Regex("^👀 View Words$"), view_words_start))
     application.add_handler(CallbackQueryHandler(handle_view_callback, pattern="^view_"))
     
-    logger.info("Bot started!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if metrics_port:
+        for handlers in application.handlers.values():
+            metrics.instrument_handlers(handlers)
+            missing = metrics.uninstrumented_callbacks(handlers)
+            if missing:
+                logger.warning("Handlers without metrics: %s", ", ".join(missing))
+        register_gauges(application)
+        metrics.start_http_server(metrics_port, METRICS_LISTEN)
+    
+    return application
+
+
+def main() -> None:
+    """Run the bot."""
+    db.init_db()
+    logger.info("Loaded %d registered users", db.load_known_users())
+    application = build_application()
+    
+    if WEBHOOK_URL:
+        logger.info("Bot started with webhook on %s:%d", WEBHOOK_LISTEN, WEBHOOK_PORT)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        logger.info("Bot started!")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
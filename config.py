@@ -1,6 +1,7 @@
 """Configuration module for the Telegram bot."""
 
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,3 +10,64 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is not set")
+
+# Number of worker threads that run database queries for the async handlers
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+# Milliseconds word adds and deletes are collected for before they are committed together
+# (0 commits every write on its own), and the most writes committed at once
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "2"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "500"))
+
+# Database files users are spread over by user ID, each with its own write lock and pool;
+# change it with reshard.py, which moves the users to their new files
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+
+# SQLite connection pool and pragmas applied to every pooled connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are in KiB, positive values are in pages (see PRAGMA cache_size)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))
+
+# Memory cap of the cache of word counts and rendered word list pages
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Seconds between batched writes of conversation and quiz state to the database
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "30"))
+
+# Bot API endpoint; point it at a local Bot API server or a test stand-in
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+
+# Users whose updates are handled at the same time; updates of one user are always
+# handled one by one, in order (1 handles all updates one by one)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+# Worker processes of workers.py, which spreads users over several cores
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 1)
+# Updates queued for handling before the bot stops taking new ones
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1000"))
+# Queued updates of one user above which further updates of that user are dropped
+MAX_PENDING_UPDATES_PER_USER = int(os.getenv("MAX_PENDING_UPDATES_PER_USER", "20"))
+
+# Outgoing message limits: messages per second over all chats (0 sends without limits) and
+# messages per second to one chat, with bursts of up to RATE_LIMIT_CHAT_BURST
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "30"))
+RATE_LIMIT_PER_CHAT = float(os.getenv("RATE_LIMIT_PER_CHAT", "1"))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", "3"))
+# Queued outgoing messages above which word list browsing replies are dropped
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "1000"))
+
+# Webhook mode: set WEBHOOK_URL to the public HTTPS base URL to receive updates through an
+# embedded HTTP server at WEBHOOK_URL/WEBHOOK_PATH instead of long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Requests without this secret token are rejected; a random one is used when unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# Parallel HTTPS connections Telegram may open to deliver updates
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Prometheus metrics are served on http://METRICS_LISTEN:METRICS_PORT/metrics; 0 disables them
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "9464")
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
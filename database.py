@@ -1,27 +1,238 @@
 """Database module for storing users and words."""
 
+import itertools
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import zlib
+from array import array
 from datetime import datetime
 from typing import Optional
 from contextlib import contextmanager
 
+import metrics
+import migrations
+import srs
+from config import (
+    DB_POOL_SIZE,
+    DB_SHARDS,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE,
+)
+
 DATABASE_NAME = "eng_diary.db"
+# Users are spread over this many database files by a hash of their ID (see shard_index)
+SHARDS = DB_SHARDS
+
+logger = logging.getLogger(__name__)
+
+_word_listeners = []
+
+# Registered users -> hash of the (username, first_name) stored for them (see register_user)
+_known_users = {}
+
+# Vocabulary version of every user whose words changed since the start (see get_vocab_version)
+_vocab_versions = {}
+_vocab_version_counter = itertools.count(1)
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived connections to one SQLite database file."""
+    
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all = []
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.connect_seconds = 0.0
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection and apply the configured pragmas."""
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {int(SQLITE_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA cache_size = {int(SQLITE_CACHE_SIZE)}")
+        self.connect_seconds += time.perf_counter() - started
+        self.connections_opened += 1
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection from the pool, opening a new one while below the size limit."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                else:
+                    conn = None
+            if conn is None:
+                conn = self._idle.get()
+        self.checkouts += 1
+        return conn
+    
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+    
+    def close(self) -> None:
+        """Close every connection owned by the pool."""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
+    
+    def stats(self) -> dict:
+        """Return how many connections were opened and the connect time saved by reuse."""
+        opened = self.connections_opened
+        avg_connect = self.connect_seconds / opened if opened else 0.0
+        reused = self.checkouts - opened
+        return {
+            "path": self.path,
+            "connections_opened": opened,
+            "checkouts": self.checkouts,
+            "reused": reused,
+            "avg_connect_ms": avg_connect * 1000,
+            "saved_ms": reused * avg_connect * 1000,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: Optional[str] = None) -> ConnectionPool:
+    """Get the connection pool for a database file (DATABASE_NAME by default)."""
+    path = path or DATABASE_NAME
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path)
+                _pools[path] = pool
+    return pool
+
+
+def close_pools() -> None:
+    """Close all pooled connections, e.g. on shutdown or after changing DATABASE_NAME."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def get_pool_stats() -> list:
+    """Get connection reuse statistics for every open pool."""
+    return [pool.stats() for pool in list(_pools.values())]
+
+
+def shard_index(user_id: int, shards: Optional[int] = None) -> int:
+    """Get the shard holding a user's data when the data is split over shards files."""
+    return zlib.crc32(user_id.to_bytes(8, "little", signed=True)) % (shards or SHARDS)
+
+
+def shard_path(index: int) -> str:
+    """Get the database file of a shard: DATABASE_NAME for shard 0, eng_diary.<index>.db after it.
+    
+    Shard 0 is also where bot persistence is kept. Going from 1 to N shards keeps the
+    existing file as shard 0, so reshard.py only has to move users out of it.
+    """
+    if index == 0:
+        return DATABASE_NAME
+    root, extension = os.path.splitext(DATABASE_NAME)
+    return f"{root}.{index}{extension}"
+
+
+def user_path(user_id: int) -> str:
+    """Get the database file holding a user's data."""
+    return shard_path(shard_index(user_id)) if SHARDS > 1 else DATABASE_NAME
 
 
 @contextmanager
-def get_connection():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
+def get_connection(user_id: Optional[int] = None, path: Optional[str] = None):
+    """Context manager for database connections, borrowed from the pool.
+    
+    The connection is to the shard of user_id if given, else to path, else to shard 0.
+    """
+    if user_id is not None:
+        path = user_path(user_id)
+    pool = get_pool(path)
+    conn = pool.acquire()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.release(conn)
+
+
+def add_word_listener(listener) -> None:
+    """Register listener(event, user_id, payload), called after every committed word change.
+    
+    event is 'add' with the new word row as payload, 'delete' with the word ID, or
+    'import' with the number of words added at once, after which listeners should
+    reload what they keep about the user instead of updating it word by word.
+    Listeners run on the thread that made the change and must be thread-safe.
+    """
+    _word_listeners.append(listener)
+
+
+def _notify_word_listeners(event: str, user_id: int, payload) -> None:
+    """Call every word listener, logging instead of raising on listener errors."""
+    for listener in _word_listeners:
+        try:
+            listener(event, user_id, payload)
+        except Exception:
+            logger.exception("Word listener %r failed on %s", listener, event)
+
+
+def get_vocab_version(user_id: int) -> int:
+    """Get a number that changes after every committed change of a user's words.
+    
+    Versions are unique across users and only grow; users whose words did not change since
+    the start have version 0. Read the version before a query to tag what the query returned.
+    """
+    return _vocab_versions.get(user_id, 0)
+
+
+def _bump_vocab_version(user_id: int) -> None:
+    """Give a user a new vocabulary version. Call after the change was committed."""
+    _vocab_versions[user_id] = next(_vocab_version_counter)
+
+
+def normalize_word(text: str) -> str:
+    """Case-fold a word, collapse its whitespace and spell ё as е."""
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def word_key(word1: str, word2: str) -> str:
+    """Get the key of a word pair in the unique index: words with equal keys are duplicates."""
+    return f"{normalize_word(word1)}\t{normalize_word(word2)}"
 
 
 def init_db():
-    """Initialize the database with required tables."""
-    with get_connection() as conn:
+    """Initialize every shard with the required tables and apply pending migrations."""
+    for index in range(SHARDS):
+        init_db_file(shard_path(index))
+
+
+def init_db_file(path: str) -> None:
+    """Create the tables in one database file and migrate it."""
+    with get_connection(path=path) as conn:
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -47,52 +258,151 @@ def init_db():
         """)
         
         conn.commit()
+        migrations.migrate(conn)
+
+
+def load_known_users() -> int:
+    """Remember every registered user, so /start of a returning user needs no query.
+    
+    Returns the number of users loaded.
+    """
+    for index in range(SHARDS):
+        with get_connection(path=shard_path(index)) as conn:
+            cursor = conn.execute("SELECT user_id, username, first_name FROM users")
+            while True:
+                rows = cursor.fetchmany(4096)
+                if not rows:
+                    break
+                for user_id, username, first_name in rows:
+                    _known_users[user_id] = hash((username, first_name))
+    return len(_known_users)
+
+
+def is_known_user(user_id: int, username: Optional[str], first_name: Optional[str]) -> bool:
+    """Check whether a user is registered with these names, without a query."""
+    return _known_users.get(user_id) == hash((username, first_name))
 
 
+@metrics.timed
 def register_user(user_id: int, username: Optional[str], first_name: Optional[str]) -> bool:
-    """Register a new user. Returns True if new user, False if already exists."""
-    with get_connection() as conn:
+    """Register a new user or update the names of a known one. Returns True if new user."""
+    fingerprint = hash((username, first_name))
+    if _known_users.get(user_id) == fingerprint:
+        return False
+    
+    created_at = datetime.now().isoformat()
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-        if cursor.fetchone():
-            return False
-        
+        # Returns no row when the user exists with the same names, and the stored
+        # created_at when the names were updated
         cursor.execute(
-            "INSERT INTO users (user_id, username, first_name, created_at) VALUES (?, ?, ?, ?)",
-            (user_id, username, first_name, datetime.now().isoformat())
+            "INSERT INTO users (user_id, username, first_name, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name "
+            "WHERE username IS NOT excluded.username OR first_name IS NOT excluded.first_name "
+            "RETURNING created_at",
+            (user_id, username, first_name, created_at)
         )
+        rows = cursor.fetchall()
         conn.commit()
-        return True
+    
+    _known_users[user_id] = fingerprint
+    return bool(rows) and rows[0][0] == created_at
 
 
-def add_translation_word(user_id: int, english: str, russian: str) -> int:
-    """Add a translation word pair. Returns the word ID."""
-    with get_connection() as conn:
+@metrics.timed
+def add_translation_word(user_id: int, english: str, russian: str) -> Optional[int]:
+    """Add a translation word pair. Returns the word ID, or None if the user already has it."""
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO words (user_id, word_type, word1, word2, created_at) VALUES (?, ?, ?, ?, ?)",
-            (user_id, "translation", english, russian, datetime.now().isoformat())
+            "INSERT INTO words (user_id, word_type, word1, word2, created_at, norm_key) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (user_id, "translation", english, russian, datetime.now().isoformat(), word_key(english, russian))
         )
         conn.commit()
-        return cursor.lastrowid
+        if not cursor.rowcount:
+            return None
+        word_id = cursor.lastrowid
+    
+    _bump_vocab_version(user_id)
+    _notify_word_listeners("add", user_id, {
+        "id": word_id, "word_type": "translation", "word1": english, "word2": russian, "word3": None
+    })
+    return word_id
 
 
-def add_irregular_verb(user_id: int, form_from: str, form_to: str, form_pair: str) -> int:
-    """Add an irregular verb pair. form_pair is '1-2' or '2-3'. Returns the word ID."""
-    with get_connection() as conn:
+@metrics.timed
+def add_irregular_verb(user_id: int, form_from: str, form_to: str, form_pair: str) -> Optional[int]:
+    """Add an irregular verb pair. form_pair is '1-2' or '2-3'.
+    
+    Returns the word ID, or None if the user already has the pair.
+    """
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO words (user_id, word_type, word1, word2, word3, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (user_id, "irregular", form_from, form_to, form_pair, datetime.now().isoformat())
+            "INSERT INTO words (user_id, word_type, word1, word2, word3, created_at, norm_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            (user_id, "irregular", form_from, form_to, form_pair, datetime.now().isoformat(),
+             word_key(form_from, form_to))
+        )
+        conn.commit()
+        if not cursor.rowcount:
+            return None
+        word_id = cursor.lastrowid
+    
+    _bump_vocab_version(user_id)
+    _notify_word_listeners("add", user_id, {
+        "id": word_id, "word_type": "irregular", "word1": form_from, "word2": form_to, "word3": form_pair
+    })
+    return word_id
+
+
+@metrics.timed
+def add_words_bulk(user_id: int, rows: list) -> dict:
+    """Add many words in one transaction. rows are (word_type, word1, word2, word3).
+    
+    Words the user already has, or that occur earlier in rows, are skipped. Returns the
+    number of words added of each word type.
+    """
+    created_at = datetime.now().isoformat()
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        # IDs only grow and nobody else writes until the commit: the new words have larger IDs
+        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM words").fetchone()[0]
+        # Indexing the words for search in one statement is about 4x faster than per row
+        cursor.execute("INSERT INTO words_fts_deferred (pending) VALUES (1)")
+        changes = conn.total_changes
+        cursor.executemany(
+            "INSERT INTO words (user_id, word_type, word1, word2, word3, created_at, norm_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            [(user_id, word_type, word1, word2, word3, created_at, word_key(word1, word2))
+             for word_type, word1, word2, word3 in rows]
         )
+        added = {}
+        # Rows written by triggers are not counted; unchanged means every word was a duplicate
+        if conn.total_changes > changes:
+            cursor.execute(
+                "INSERT INTO words_fts (rowid, word1, word2, user_id) "
+                "SELECT id, word1, word2, user_id FROM words WHERE id > ?",
+                (last_id,)
+            )
+            cursor.execute("SELECT word_type, COUNT(*) FROM words WHERE id > ? GROUP BY word_type", (last_id,))
+            added = dict(cursor.fetchall())
+        cursor.execute("DELETE FROM words_fts_deferred")
         conn.commit()
-        return cursor.lastrowid
+    
+    count = sum(added.values())
+    if count:
+        _bump_vocab_version(user_id)
+        _notify_word_listeners("import", user_id, count)
+    return added
 
 
+@metrics.timed
 def get_all_words(user_id: int, word_type: Optional[str] = None) -> list:
     """Get all words for a user, optionally filtered by type."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         if word_type:
             cursor.execute(
@@ -107,9 +417,10 @@ def get_all_words(user_id: int, word_type: Optional[str] = None) -> list:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@metrics.timed
 def get_last_words(user_id: int, limit: int = 30, word_type: Optional[str] = None) -> list:
     """Get last N words for a user, optionally filtered by type."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         if word_type:
             cursor.execute(
@@ -124,9 +435,82 @@ def get_last_words(user_id: int, limit: int = 30, word_type: Optional[str] = Non
         return [dict(row) for row in cursor.fetchall()]
 
 
+@metrics.timed
+def get_word_ids(user_id: int) -> array:
+    """Get the IDs of all words of a user, read from the index without touching the rows."""
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM words WHERE user_id = ?", (user_id,))
+        word_ids = array("q")
+        while True:
+            rows = cursor.fetchmany(4096)
+            if not rows:
+                return word_ids
+            word_ids.extend(row[0] for row in rows)
+
+
+@metrics.timed
+def iter_words(user_id: int, batch_size: int = 1000):
+    """Yield (word_type, word1, word2, word3) of all words of a user, oldest first.
+    
+    Rows are fetched batch_size at a time from an open cursor, so memory use does not
+    grow with the vocabulary. The generator holds a pooled connection until it is
+    exhausted or closed.
+    """
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT word_type, word1, word2, word3 FROM words WHERE user_id = ? ORDER BY created_at, id",
+            (user_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+
+@metrics.timed
+def get_words_by_ids(user_id: int, word_ids: list) -> list:
+    """Get the words of a user with the given IDs, in no particular order."""
+    words = []
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        # Stay well below SQLite's limit on the number of query parameters
+        for start in range(0, len(word_ids), 500):
+            chunk = list(word_ids[start:start + 500])
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT * FROM words WHERE user_id = ? AND id IN ({placeholders})",
+                (user_id, *chunk)
+            )
+            words.extend(dict(row) for row in cursor.fetchall())
+    return words
+
+
+@metrics.timed
+def get_random_words(user_id: int, word_type: str, form_pair: Optional[str] = None, limit: int = 50) -> list:
+    """Get up to limit random words of one type (and form pair, for irregular verbs)."""
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        if form_pair:
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? AND word_type = ? AND word3 = ? "
+                "ORDER BY random() LIMIT ?",
+                (user_id, word_type, form_pair, limit)
+            )
+        else:
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? AND word_type = ? ORDER BY random() LIMIT ?",
+                (user_id, word_type, limit)
+            )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+@metrics.timed
 def get_words_for_wrong_answers(user_id: int, word_type: str, exclude_id: int) -> list:
     """Get words of the same type for generating wrong answers, excluding the current word."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "SELECT * FROM words WHERE user_id = ? AND word_type = ? AND id != ?",
@@ -135,9 +519,10 @@ def get_words_for_wrong_answers(user_id: int, word_type: str, exclude_id: int) -
         return [dict(row) for row in cursor.fetchall()]
 
 
+@metrics.timed
 def get_word_count(user_id: int, word_type: Optional[str] = None) -> int:
     """Get the count of words for a user, optionally filtered by type."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         if word_type:
             cursor.execute(
@@ -152,9 +537,10 @@ def get_word_count(user_id: int, word_type: Optional[str] = None) -> int:
         return cursor.fetchone()[0]
 
 
+@metrics.timed
 def get_words_paginated(user_id: int, offset: int = 0, limit: int = 5) -> list:
     """Get words for a user with pagination."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "SELECT * FROM words WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
@@ -163,13 +549,288 @@ def get_words_paginated(user_id: int, offset: int = 0, limit: int = 5) -> list:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@metrics.timed
+def get_words_page(user_id: int, limit: int = 5, direction: str = "first", position: Optional[tuple] = None) -> list:
+    """Get a page of words, newest first, using keyset pagination on (created_at, id).
+    
+    direction is one of:
+    - 'first': the newest words
+    - 'next': words older than position (the last word of the current page)
+    - 'prev': words newer than position (the first word of the current page)
+    - 'last': the oldest words
+    position is a (created_at, id) tuple. Every direction costs the same regardless of page depth.
+    """
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        if direction == "next":
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? AND (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, position[0], position[1], limit)
+            )
+        elif direction == "prev":
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? AND (created_at, id) > (?, ?) "
+                "ORDER BY created_at, id LIMIT ?",
+                (user_id, position[0], position[1], limit)
+            )
+        elif direction == "last":
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? ORDER BY created_at, id LIMIT ?",
+                (user_id, limit)
+            )
+        else:
+            cursor.execute(
+                "SELECT * FROM words WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit)
+            )
+        words = [dict(row) for row in cursor.fetchall()]
+        if direction in ("prev", "last"):
+            words.reverse()
+        return words
+
+
+@metrics.timed
+def search_words(user_id: int, match: str, limit: int = 50) -> list:
+    """Get up to limit words of a user matching an FTS5 query over word1 and word2, by word1.
+    
+    match is a query built by search.build_match; the user filter is added here. Ordering
+    by rank would score every row of the index matching the prefix, of all users.
+    """
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT w.* FROM words_fts f JOIN words w ON w.id = f.rowid "
+            "WHERE words_fts MATCH ? ORDER BY w.word1 COLLATE NOCASE, w.id LIMIT ?",
+            (f"user_id:{int(user_id)} AND ({match})", limit)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+@metrics.timed
+def get_due_words(user_id: int, limit: int = 30, now: Optional[datetime] = None) -> list:
+    """Get up to limit words due for review, the longest overdue first."""
+    now = now or datetime.now()
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT w.* FROM reviews r JOIN words w ON w.id = r.word_id "
+            "WHERE r.user_id = ? AND r.due_at <= ? ORDER BY r.due_at LIMIT ?",
+            (user_id, now.isoformat(), limit)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+@metrics.timed
+def get_next_due_at(user_id: int) -> Optional[str]:
+    """Get when the next word of a user becomes due, or None if they have no words."""
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT MIN(due_at) FROM reviews WHERE user_id = ?",
+            (user_id,)
+        )
+        return cursor.fetchone()[0]
+
+
+@metrics.timed
+def record_review(user_id: int, word_id: int, quality: int, now: Optional[datetime] = None) -> Optional[str]:
+    """Reschedule a word after a quiz answer of the given SM-2 quality. Returns the new due time."""
+    now = now or datetime.now()
+    with get_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT ease, interval_days, repetitions FROM reviews WHERE word_id = ? AND user_id = ?",
+            (word_id, user_id)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        
+        ease, interval_days, repetitions, due_at = srs.schedule(
+            row["ease"], row["interval_days"], row["repetitions"], quality, now
+        )
+        cursor.execute(
+            "UPDATE reviews SET ease = ?, interval_days = ?, repetitions = ?, due_at = ?, reviewed_at = ? "
+            "WHERE word_id = ?",
+            (ease, interval_days, repetitions, due_at, now.isoformat(), word_id)
+        )
+        conn.commit()
+        return due_at
+
+
+@metrics.timed
 def delete_word(user_id: int, word_id: int) -> bool:
     """Delete a word by ID. Returns True if word was deleted."""
-    with get_connection() as conn:
+    with get_connection(user_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "DELETE FROM words WHERE id = ? AND user_id = ?",
             (word_id, user_id)
         )
         conn.commit()
-        return cursor.rowcount > 0
+        deleted = cursor.rowcount > 0
+    
+    if deleted:
+        _bump_vocab_version(user_id)
+        _notify_word_listeners("delete", user_id, word_id)
+    return deleted
+
+
+@metrics.timed
+def dedupe_words(path: str, after_id: int, limit: int = 200) -> tuple:
+    """Set the key of up to limit words without one after after_id, deleting duplicates.
+    
+    Runs in one transaction on one database file; see dedupe.py. Of the words with the same
+    key, the oldest is kept. Returns (last word ID looked at, or None when no word without
+    a key is left, words keyed, duplicates deleted).
+    """
+    deleted = []
+    keyed = 0
+    with get_connection(path=path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        rows = cursor.execute(
+            "SELECT id, user_id, word_type, word1, word2, word3 FROM words "
+            "WHERE id > ? AND norm_key IS NULL ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+        
+        for row in rows:
+            key = word_key(row["word1"], row["word2"])
+            existing = cursor.execute(
+                "SELECT id FROM words WHERE user_id = ? AND word_type = ? AND COALESCE(word3, '') = ? "
+                "AND norm_key = ?",
+                (row["user_id"], row["word_type"], row["word3"] or "", key)
+            ).fetchone()
+            if existing is not None and existing["id"] < row["id"]:
+                cursor.execute("DELETE FROM words WHERE id = ?", (row["id"],))
+                deleted.append((row["user_id"], row["id"]))
+                continue
+            if existing is not None:
+                # Added again after the migration; the copy being keyed is older
+                cursor.execute("DELETE FROM words WHERE id = ?", (existing["id"],))
+                deleted.append((row["user_id"], existing["id"]))
+            cursor.execute("UPDATE words SET norm_key = ? WHERE id = ?", (key, row["id"]))
+            keyed += 1
+        conn.commit()
+    
+    for user_id, word_id in deleted:
+        _bump_vocab_version(user_id)
+        _notify_word_listeners("delete", user_id, word_id)
+    last_id = rows[-1]["id"] if rows else None
+    return last_id, keyed, len(deleted)
+
+
+# Statements of the writes apply_word_writes takes: op -> (SQL, word_type)
+_WORD_WRITES = {
+    "add_translation": (
+        "INSERT INTO words (user_id, word_type, word1, word2, created_at, norm_key) "
+        "VALUES (?, 'translation', ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        "translation",
+    ),
+    "add_irregular": (
+        "INSERT INTO words (user_id, word_type, word1, word2, word3, created_at, norm_key) "
+        "VALUES (?, 'irregular', ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        "irregular",
+    ),
+    "delete": ("DELETE FROM words WHERE user_id = ? AND id = ?", None),
+}
+
+
+@metrics.timed
+def apply_word_writes(path: str, writes: list) -> list:
+    """Apply word writes of users stored in one database file in a single transaction.
+    
+    writes are (op, user_id, args): ('add_translation', user_id, (english, russian)),
+    ('add_irregular', user_id, (form_from, form_to, form_pair)) or ('delete', user_id, (word_id,)).
+    Returns, in order, what add_translation_word, add_irregular_verb or delete_word would
+    return for each write, or the exception it raised; a failed write does not undo the others.
+    Listeners are notified after the commit, as for the single writes.
+    """
+    created_at = datetime.now().isoformat()
+    results = []
+    with get_connection(path=path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        for op, user_id, args in writes:
+            sql, word_type = _WORD_WRITES[op]
+            cursor.execute("SAVEPOINT word_write")
+            try:
+                if word_type is None:
+                    cursor.execute(sql, (user_id, *args))
+                    results.append(cursor.rowcount > 0)
+                else:
+                    cursor.execute(sql, (user_id, *args, created_at, word_key(args[0], args[1])))
+                    results.append(cursor.lastrowid if cursor.rowcount else None)
+            except sqlite3.Error as error:
+                cursor.execute("ROLLBACK TO word_write")
+                results.append(error)
+            cursor.execute("RELEASE word_write")
+        conn.commit()
+    
+    for (op, user_id, args), result in zip(writes, results):
+        if isinstance(result, Exception) or result is None or result is False:
+            continue
+        _bump_vocab_version(user_id)
+        if op == "delete":
+            _notify_word_listeners("delete", user_id, args[0])
+        else:
+            word3 = args[2] if op == "add_irregular" else None
+            _notify_word_listeners("add", user_id, {
+                "id": result, "word_type": _WORD_WRITES[op][1], "word1": args[0], "word2": args[1], "word3": word3
+            })
+    return results
+
+
+@metrics.timed
+def get_persisted_data(kind: str, key: int) -> Optional[bytes]:
+    """Get the pickled bot persistence data of a kind ('user', 'chat', 'bot', 'callback') by ID."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT data FROM persisted_data WHERE kind = ? AND id = ?",
+            (kind, key)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+@metrics.timed
+def get_persisted_conversations(name: str) -> list:
+    """Get (key, state) JSON pairs of the stored conversations of a handler."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT key, state FROM persisted_conversations WHERE name = ?",
+            (name,)
+        )
+        return cursor.fetchall()
+
+
+@metrics.timed
+def save_persisted(data_rows: list, dropped_data: list, conversation_rows: list, ended_conversations: list) -> None:
+    """Write a batch of bot persistence changes in one transaction.
+    
+    data_rows are (kind, id, pickle), dropped_data (kind, id), conversation_rows
+    (name, key, state) and ended_conversations (name, key).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO persisted_data (kind, id, data) VALUES (?, ?, ?)",
+            data_rows
+        )
+        cursor.executemany(
+            "DELETE FROM persisted_data WHERE kind = ? AND id = ?",
+            dropped_data
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO persisted_conversations (name, key, state) VALUES (?, ?, ?)",
+            conversation_rows
+        )
+        cursor.executemany(
+            "DELETE FROM persisted_conversations WHERE name = ? AND key = ?",
+            ended_conversations
+        )
+        conn.commit()
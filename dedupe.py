@@ -0,0 +1,68 @@
+"""Fill in the normalized keys of words added before migration 5 and remove duplicates.
+
+New words get their key (database.word_key) on insert and the unique index rejects
+duplicates. Words stored before the migration have no key yet. This job walks them by ID in
+small batches and runs while the bot keeps running:
+
+    python dedupe.py
+
+Each batch is one short write transaction. A word whose key the user already has is a
+duplicate: the oldest copy, with its review schedule, is kept and the others are deleted.
+Between batches the job pauses so the bot's writes get the lock. An interrupted run simply
+continues where it stopped when started again.
+
+A running bot learns about deleted copies only through word listeners of its own process,
+so its cached word pages and quiz tables may show them until the user's next change.
+"""
+
+import sys
+import time
+
+import database as db
+
+# Words keyed per transaction
+DEDUPE_BATCH_SIZE = 200
+# Seconds between batches
+DEDUPE_PAUSE = 0.05
+
+
+def dedupe_file(path: str, batch_size: int = DEDUPE_BATCH_SIZE, pause: float = DEDUPE_PAUSE) -> dict:
+    """Key every word of one database file, batch by batch."""
+    keyed = 0
+    deleted = 0
+    last_id = 0
+    while True:
+        last_id, batch_keyed, batch_deleted = db.dedupe_words(path, last_id, batch_size)
+        if last_id is None:
+            break
+        keyed += batch_keyed
+        deleted += batch_deleted
+        time.sleep(pause)
+    return {"keyed": keyed, "deleted": deleted}
+
+
+def dedupe(batch_size: int = DEDUPE_BATCH_SIZE, pause: float = DEDUPE_PAUSE) -> dict:
+    """Key the words of every shard and delete the duplicates."""
+    started = time.perf_counter()
+    db.init_db()
+    keyed = 0
+    deleted = 0
+    for index in range(db.SHARDS):
+        result = dedupe_file(db.shard_path(index), batch_size, pause)
+        keyed += result["keyed"]
+        deleted += result["deleted"]
+    return {"keyed": keyed, "deleted": deleted, "seconds": time.perf_counter() - started}
+
+
+def main() -> int:
+    """Deduplicate the configured database, optionally with the batch size given on the command line."""
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEDUPE_BATCH_SIZE
+    result = dedupe(batch_size)
+    db.close_pools()
+    print(f"Keyed {result['keyed']} words and deleted {result['deleted']} duplicates "
+          f"in {result['seconds']:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Export of a user's vocabulary as a CSV or Anki-importable TSV file.
+
+Words are streamed from the database and written row by row into a spooled temporary
+file, which stays in memory while small and moves to disk when it grows, so building
+an export takes the same memory for ten words and for a million.
+"""
+
+import csv
+import io
+import tempfile
+
+import database as db
+
+# Exports up to this size are built in memory, larger ones in a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+EXPORT_FORMATS = ("csv", "anki")
+
+FORM_PAIR_LABELS = {
+    "1-2": "Infinitive → Past Simple",
+    "2-3": "Past Simple → Past Participle",
+}
+
+
+def write_csv(rows, out) -> int:
+    """Write words in the format accepted by the importer. Returns the number of words."""
+    writer = csv.writer(out)
+    writer.writerow(["english", "russian", "form_pair"])
+    count = 0
+    for word_type, word1, word2, word3 in rows:
+        writer.writerow([word1, word2] if word_type == "translation" else [word1, word2, word3])
+        count += 1
+    return count
+
+
+def write_anki(rows, out) -> int:
+    """Write words as Anki notes (front, back, tags). Returns the number of words."""
+    # File headers understood by Anki 2.1.55+ when importing text files
+    out.write("#separator:tab\n#html:false\n#tags column:3\n")
+    writer = csv.writer(out, delimiter="\t", lineterminator="\n")
+    count = 0
+    for word_type, word1, word2, word3 in rows:
+        if word_type == "translation":
+            writer.writerow([word1, word2, "eng-diary translation"])
+        else:
+            front = f"{word1} ({FORM_PAIR_LABELS.get(word3, word3)})"
+            writer.writerow([front, word2, f"eng-diary irregular_{word3}"])
+        count += 1
+    return count
+
+
+def export_words(user_id: int, export_format: str = "csv") -> tuple:
+    """Write all words of a user into a new file. Blocking.
+    
+    Returns (file, count). The binary file is positioned at its start and must be
+    closed by the caller.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    # UTF-8 with a byte order mark, so that Excel detects the encoding of the CSV
+    encoding = "utf-8-sig" if export_format == "csv" else "utf-8"
+    out = io.TextIOWrapper(buffer, encoding=encoding, newline="")
+    write = write_anki if export_format == "anki" else write_csv
+    
+    try:
+        count = write(db.iter_words(user_id), out)
+        out.flush()
+    except Exception:
+        buffer.close()
+        raise
+    out.detach()
+    buffer.seek(0)
+    return buffer, count
@@ -0,0 +1,144 @@
+"""Bulk import of words from uploaded CSV/TSV documents.
+
+Every row is either a translation (english, russian) or an irregular verb pair
+(form_from, form_to, form_pair) where form_pair is 1-2 or 2-3. The delimiter (tab,
+semicolon or comma) is detected from the first line and a header row is skipped.
+Rows are parsed lazily and inserted in batches, one transaction per batch.
+"""
+
+import codecs
+import csv
+import io
+import itertools
+from typing import BinaryIO
+
+import database as db
+
+# Rows inserted per transaction
+IMPORT_BATCH_SIZE = 5000
+# Largest file a bot can download through the Bot API
+MAX_FILE_SIZE = 20 * 1024 * 1024
+MAX_WORD_LENGTH = 100
+# Invalid rows described in the import report; the rest are only counted
+MAX_REPORTED_ERRORS = 5
+
+DELIMITERS = ("\t", ";", ",")
+FORM_PAIRS = ("1-2", "2-3")
+HEADER_NAMES = {"english", "russian", "word", "translation", "word1", "word2", "word3",
+                "form_from", "form_to", "form_pair", "forms"}
+# Bytes looked at to tell UTF-8 files from Windows-1251 ones saved by Excel
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Guess the encoding of a document from its first bytes."""
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return "cp1251"
+    return "utf-8-sig"
+
+
+def detect_delimiter(line: str) -> str:
+    """Pick the delimiter that occurs most often in a line, preferring tabs on ties."""
+    return max(DELIMITERS, key=line.count)
+
+
+def is_header(cells: list) -> bool:
+    """Check whether a row names its columns instead of holding a word."""
+    return all(cell.strip().casefold() in HEADER_NAMES for cell in cells if cell.strip())
+
+
+def parse_row(cells: list) -> tuple:
+    """Validate a row and turn it into (word_type, word1, word2, word3).
+    
+    Raises ValueError with the reason when the row is invalid.
+    """
+    cells = [cell.strip() for cell in cells]
+    while cells and not cells[-1]:
+        cells.pop()
+    
+    if len(cells) not in (2, 3):
+        raise ValueError(f"expected 2 or 3 columns, got {len(cells)}")
+    if not cells[0] or not cells[1]:
+        raise ValueError("empty word")
+    if len(cells[0]) > MAX_WORD_LENGTH or len(cells[1]) > MAX_WORD_LENGTH:
+        raise ValueError(f"word longer than {MAX_WORD_LENGTH} characters")
+    
+    if len(cells) == 2:
+        return ("translation", cells[0], cells[1], None)
+    if cells[2] not in FORM_PAIRS:
+        raise ValueError(f"form pair must be 1-2 or 2-3, got {cells[2]!r}")
+    return ("irregular", cells[0], cells[1], cells[2])
+
+
+class ImportJob:
+    """Streams the rows of one document into a user's vocabulary.
+    
+    Not thread-safe: call import_batch() from one thread at a time, for example
+    through async_database.run().
+    """
+    
+    def __init__(self, user_id: int, raw: BinaryIO):
+        self.user_id = user_id
+        self.imported = 0
+        self.translations = 0
+        self.verbs = 0
+        self.skipped = 0
+        # Rows the user already had or that were earlier in the document
+        self.duplicates = 0
+        # (line number, reason) of the first invalid rows
+        self.errors = []
+        # (line number, reason) of a line the CSV reader failed on; the lines after it are not read
+        self.stopped = None
+        
+        encoding = detect_encoding(raw.read(ENCODING_SAMPLE_SIZE))
+        raw.seek(0)
+        self._text = io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline="")
+        self._rows = self._parse()
+    
+    def _parse(self):
+        first_line = self._text.readline()
+        reader = csv.reader(itertools.chain([first_line], self._text), delimiter=detect_delimiter(first_line))
+        
+        while True:
+            line_number = reader.line_num + 1
+            try:
+                cells = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                # A stray quote makes the reader take the rest of the file as one field
+                self.skipped += 1
+                self.stopped = (line_number, f"unreadable line, check for a stray quote ({error})")
+                return
+            
+            if not any(cell.strip() for cell in cells):
+                continue
+            if reader.line_num == 1 and is_header(cells):
+                continue
+            try:
+                row = parse_row(cells)
+            except ValueError as error:
+                self.skipped += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append((reader.line_num, str(error)))
+                continue
+            yield row
+    
+    def import_batch(self, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+        """Parse and insert the next batch of rows. Blocking.
+        
+        Returns the number of rows read, 0 once the document is exhausted.
+        """
+        batch = list(itertools.islice(self._rows, batch_size))
+        if not batch:
+            return 0
+        
+        added = db.add_words_bulk(self.user_id, batch)
+        count = sum(added.values())
+        self.imported += count
+        self.duplicates += len(batch) - count
+        self.verbs += added.get("irregular", 0)
+        self.translations += added.get("translation", 0)
+        return len(batch)
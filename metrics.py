@@ -0,0 +1,258 @@
+"""Prometheus metrics of the bot: handler latency, database timing and live state gauges.
+
+Only the standard library is used. Histograms are updated on the hot path without
+locks, counters only on errors; gauges are computed when scraped. Metrics are
+served in the Prometheus text format by start_http_server().
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "engdiary"
+
+HANDLER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _format_labels(label_name: str, label_value: str, extra: str = "") -> str:
+    value = str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{{{label_name}="{value}"{extra}}}'
+
+
+class Counter:
+    """Monotonic counter with one label."""
+    
+    def __init__(self, name: str, help_text: str, label_name: str):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_value, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_name, label_value)} {value}")
+        return lines
+
+
+class Histogram:
+    """Histogram with one label and fixed buckets (upper bounds in seconds).
+    
+    Every thread counts into its own shard, so observations take no lock; shards are
+    summed when rendered.
+    """
+    
+    def __init__(self, name: str, help_text: str, label_name: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = buckets
+        # One {label value: [count per bucket (last one is +Inf), sum, count]} per thread
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def _new_shard(self) -> dict:
+        shard = self._local.shard = {}
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+    
+    def observe(self, label_value: str, value: float) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        series = shard.get(label_value)
+        if series is None:
+            series = shard[label_value] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        totals = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for label_value, series in list(shard.items()):
+                total = totals.setdefault(label_value, [0] * len(series))
+                for index, value in enumerate(list(series)):
+                    total[index] += value
+        
+        for label_value, series in sorted(totals.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), series):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_name, label_value, f',le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_name, label_value)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+handler_duration = Histogram(
+    f"{PREFIX}_handler_duration_seconds", "Time spent in bot handlers.", "handler", HANDLER_BUCKETS
+)
+handler_errors = Counter(f"{PREFIX}_handler_errors_total", "Handler calls that raised.", "handler")
+query_duration = Histogram(
+    f"{PREFIX}_db_query_duration_seconds", "Time spent in database functions.", "function", QUERY_BUCKETS
+)
+query_errors = Counter(f"{PREFIX}_db_errors_total", "Database function calls that raised.", "function")
+
+# name -> (help text, label name or None, function returning a number or {label value: number})
+_gauges = {}
+
+
+def add_gauge(name: str, help_text: str, collect, label_name: Optional[str] = None) -> None:
+    """Register a gauge computed by collect() on every scrape.
+    
+    collect is called on the metrics server thread and must only read shared state.
+    """
+    _gauges[f"{PREFIX}_{name}"] = (help_text, label_name, collect)
+
+
+def timed(func):
+    """Decorate a database function to record its call count, duration and errors.
+    
+    Generator functions are timed from the first to the last row they produce.
+    """
+    name = func.__name__
+    
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            except Exception:
+                query_errors.inc(name)
+                raise
+            finally:
+                query_duration.observe(name, time.perf_counter() - started)
+        return generator_wrapper
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            query_errors.inc(name)
+            raise
+        finally:
+            query_duration.observe(name, time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_callback(callback):
+    """Wrap a handler callback to record its latency and errors."""
+    name = callback.__name__
+    
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(name, time.perf_counter() - started)
+    # Other decorators set __wrapped__ too, so instrumented callbacks get their own mark
+    wrapper._metrics_instrumented = True
+    return wrapper
+
+
+def _leaf_handlers(handlers):
+    """Yield handlers, replacing conversation handlers with the handlers nested in them."""
+    for handler in handlers:
+        if hasattr(handler, "entry_points"):
+            nested = handler.entry_points + handler.fallbacks
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            yield from _leaf_handlers(nested)
+        else:
+            yield handler
+
+
+def instrument_handlers(handlers) -> None:
+    """Instrument the callbacks of handlers, including those nested in conversation handlers."""
+    for handler in _leaf_handlers(handlers):
+        if not getattr(handler.callback, "_metrics_instrumented", False):
+            handler.callback = instrument_callback(handler.callback)
+
+
+def uninstrumented_callbacks(handlers) -> list:
+    """Get the names of handler callbacks that record no latency or errors."""
+    return [
+        handler.callback.__name__ for handler in _leaf_handlers(handlers)
+        if not getattr(handler.callback, "_metrics_instrumented", False)
+    ]
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in (handler_duration, handler_errors, query_duration, query_errors):
+        lines.extend(metric.render())
+    
+    for name, (help_text, label_name, collect) in sorted(_gauges.items()):
+        try:
+            value = collect()
+        except Exception:
+            logger.exception("Could not collect gauge %s", name)
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for label_value, label_metric in sorted(value.items()):
+                lines.append(f"{name}{_format_labels(label_name, label_value)} {label_metric}")
+        else:
+            lines.append(f"{name} {value}")
+    
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format: str, *args) -> None:
+        # Scrapes every few seconds would flood the bot log
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics on a daemon thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,260 @@
+"""Versioned schema migrations for the SQLite database.
+
+The schema version is stored in ``PRAGMA user_version``. Each migration runs in its own
+transaction together with the version bump, so a database is always at a known version.
+Run this module directly to migrate the database and check the hot query plans:
+
+    python migrations.py
+"""
+
+import sqlite3
+import sys
+
+
+def _m001_word_indexes(cursor: sqlite3.Cursor) -> None:
+    """Add composite indexes covering the per-user word list, count and page queries."""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_words_user_type_created "
+        "ON words (user_id, word_type, created_at)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_words_user_created "
+        "ON words (user_id, created_at)"
+    )
+
+
+def _m002_reviews(cursor: sqlite3.Cursor) -> None:
+    """Add the spaced repetition schedule of every word, kept in sync with words by triggers."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reviews (
+            word_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            ease REAL NOT NULL DEFAULT 2.5,
+            interval_days REAL NOT NULL DEFAULT 0,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            due_at TEXT NOT NULL,
+            reviewed_at TEXT,
+            FOREIGN KEY (word_id) REFERENCES words (id)
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_user_due ON reviews (user_id, due_at)"
+    )
+    # New words are due right away; removing a word removes its schedule
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS words_reviews_insert AFTER INSERT ON words
+        BEGIN
+            INSERT INTO reviews (word_id, user_id, due_at) VALUES (new.id, new.user_id, new.created_at);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS words_reviews_delete AFTER DELETE ON words
+        BEGIN
+            DELETE FROM reviews WHERE word_id = old.id;
+        END
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO reviews (word_id, user_id, due_at)
+        SELECT id, user_id, created_at FROM words
+    """)
+
+
+def _m003_persistence(cursor: sqlite3.Cursor) -> None:
+    """Add the tables of the bot persistence (see persistence.py)."""
+    # kind is 'user', 'chat', 'bot' or 'callback'; data is a pickle
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_data (
+            kind TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, id)
+        ) WITHOUT ROWID
+    """)
+    # key and state are JSON, as in telegram.ext.DictPersistence
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    """)
+
+
+def _m004_words_fts(cursor: sqlite3.Cursor) -> None:
+    """Add a full-text index of word1 and word2 for prefix search, kept in sync by triggers."""
+    # The index stores no text of its own (content=words); user_id is indexed as a token
+    # so that a search only visits the rows of one user
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+            word1, word2, user_id,
+            content='words', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS words_fts_insert AFTER INSERT ON words
+        BEGIN
+            INSERT INTO words_fts (rowid, word1, word2, user_id) VALUES (new.id, new.word1, new.word2, new.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS words_fts_delete AFTER DELETE ON words
+        BEGIN
+            INSERT INTO words_fts (words_fts, rowid, word1, word2, user_id)
+            VALUES ('delete', old.id, old.word1, old.word2, old.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS words_fts_update AFTER UPDATE OF word1, word2, user_id ON words
+        BEGIN
+            INSERT INTO words_fts (words_fts, rowid, word1, word2, user_id)
+            VALUES ('delete', old.id, old.word1, old.word2, old.user_id);
+            INSERT INTO words_fts (rowid, word1, word2, user_id) VALUES (new.id, new.word1, new.word2, new.user_id);
+        END
+    """)
+    cursor.execute("INSERT INTO words_fts (words_fts) VALUES ('rebuild')")
+
+
+def _m005_word_keys(cursor: sqlite3.Cursor) -> None:
+    """Add the normalized key of every word and a unique index on it to reject duplicates."""
+    # norm_key is database.word_key(word1, word2), set on insert. Existing words keep NULL,
+    # which the index leaves out, until dedupe.py fills it in and removes the duplicates
+    cursor.execute("ALTER TABLE words ADD COLUMN norm_key TEXT")
+    # word3 is NULL for translations; NULLs never conflict, so the index uses ''
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_words_user_key "
+        "ON words (user_id, word_type, COALESCE(word3, ''), norm_key) WHERE norm_key IS NOT NULL"
+    )
+
+
+def _m006_bulk_fts(cursor: sqlite3.Cursor) -> None:
+    """Let bulk inserts index their words in the full-text index with one statement."""
+    # While a transaction holds a row here, the insert trigger leaves the words to it
+    # (see database.add_words_bulk); the row is deleted before the commit
+    cursor.execute("CREATE TABLE IF NOT EXISTS words_fts_deferred (pending INTEGER NOT NULL)")
+    cursor.execute("DROP TRIGGER IF EXISTS words_fts_insert")
+    cursor.execute("""
+        CREATE TRIGGER words_fts_insert AFTER INSERT ON words
+        WHEN NOT EXISTS (SELECT 1 FROM words_fts_deferred)
+        BEGIN
+            INSERT INTO words_fts (rowid, word1, word2, user_id) VALUES (new.id, new.word1, new.word2, new.user_id);
+        END
+    """)
+
+
+# Migration N is MIGRATIONS[N - 1]. Only ever append to this list.
+MIGRATIONS = [
+    _m001_word_indexes,
+    _m002_reviews,
+    _m003_persistence,
+    _m004_words_fts,
+    _m005_word_keys,
+    _m006_bulk_fts,
+]
+
+# Queries issued by the database module on every handler call: (name, sql, params)
+HOT_QUERIES = [
+    ("get_all_words",
+     "SELECT * FROM words WHERE user_id = ? ORDER BY created_at", (1,)),
+    ("get_all_words[type]",
+     "SELECT * FROM words WHERE user_id = ? AND word_type = ? ORDER BY created_at", (1, "translation")),
+    ("get_last_words",
+     "SELECT * FROM words WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (1, 30)),
+    ("get_last_words[type]",
+     "SELECT * FROM words WHERE user_id = ? AND word_type = ? ORDER BY created_at DESC LIMIT ?",
+     (1, "translation", 30)),
+    ("get_word_ids",
+     "SELECT id FROM words WHERE user_id = ?", (1,)),
+    ("iter_words",
+     "SELECT word_type, word1, word2, word3 FROM words WHERE user_id = ? ORDER BY created_at, id", (1,)),
+    ("get_words_by_ids",
+     "SELECT * FROM words WHERE user_id = ? AND id IN (?, ?)", (1, 1, 2)),
+    ("get_due_words",
+     "SELECT w.* FROM reviews r JOIN words w ON w.id = r.word_id "
+     "WHERE r.user_id = ? AND r.due_at <= ? ORDER BY r.due_at LIMIT ?", (1, "", 30)),
+    ("record_review",
+     "SELECT ease, interval_days, repetitions FROM reviews WHERE word_id = ? AND user_id = ?", (1, 1)),
+    ("get_words_for_wrong_answers",
+     "SELECT * FROM words WHERE user_id = ? AND word_type = ? AND id != ?", (1, "translation", 1)),
+    ("get_word_count",
+     "SELECT COUNT(*) FROM words WHERE user_id = ?", (1,)),
+    ("get_word_count[type]",
+     "SELECT COUNT(*) FROM words WHERE user_id = ? AND word_type = ?", (1, "translation")),
+    ("get_words_paginated",
+     "SELECT * FROM words WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?", (1, 5, 0)),
+    ("get_words_page[first]",
+     "SELECT * FROM words WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?", (1, 5)),
+    ("get_words_page[next]",
+     "SELECT * FROM words WHERE user_id = ? AND (created_at, id) < (?, ?) "
+     "ORDER BY created_at DESC, id DESC LIMIT ?", (1, "", 0, 5)),
+    ("get_words_page[prev]",
+     "SELECT * FROM words WHERE user_id = ? AND (created_at, id) > (?, ?) "
+     "ORDER BY created_at, id LIMIT ?", (1, "", 0, 5)),
+    ("get_words_page[last]",
+     "SELECT * FROM words WHERE user_id = ? ORDER BY created_at, id LIMIT ?", (1, 5)),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the schema version stored in the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply all pending migrations. Returns the resulting schema version."""
+    version = get_schema_version(conn)
+    
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        version = target
+    
+    return version
+
+
+def check_query_plans(conn: sqlite3.Connection) -> list:
+    """Run EXPLAIN QUERY PLAN on every hot query.
+    
+    Returns a list of (name, plan detail) for each step that scans a table or index
+    instead of searching it, or that sorts rows in a temporary b-tree.
+    """
+    problems = []
+    
+    for name, sql, params in HOT_QUERIES:
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+            detail = row[3]
+            if detail.startswith("SCAN") or "TEMP B-TREE" in detail:
+                problems.append((name, detail))
+    
+    return problems
+
+
+def main() -> int:
+    """Migrate the configured database and verify that no hot query does a full scan."""
+    import database as db
+    
+    db.init_db()
+    
+    with db.get_connection() as conn:
+        print(f"Schema version: {get_schema_version(conn)}")
+        problems = check_query_plans(conn)
+    
+    for name, detail in problems:
+        print(f"FULL SCAN in {name}: {detail}")
+    
+    if not problems:
+        print(f"All {len(HOT_QUERIES)} hot queries use an index.")
+    
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
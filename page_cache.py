@@ -0,0 +1,116 @@
+"""Per-user cache of word counts and rendered word list pages.
+
+Entries are tagged with the user's vocabulary version (see database.get_vocab_version).
+Adding or deleting a word gives the user a new version, so older entries are never served
+again; they are dropped when looked up or evicted as least recently used. The cache is only
+used from the event loop thread and needs no lock.
+"""
+
+import sys
+from collections import OrderedDict
+
+import database as db
+from config import PAGE_CACHE_MAX_BYTES
+
+# Rough cost of an entry besides its value: key tuple, dict slot and entry tuple
+ENTRY_OVERHEAD = 200
+
+
+def value_size(value) -> int:
+    """Approximate bytes held by a cached count or (text, keyboard) page."""
+    if not isinstance(value, tuple):
+        return sys.getsizeof(value)
+    
+    text, keyboard = value
+    size = sys.getsizeof(text) + sys.getsizeof(keyboard)
+    for row in keyboard.inline_keyboard:
+        size += sys.getsizeof(row)
+        for button in row:
+            size += sys.getsizeof(button) + sys.getsizeof(button.text) + sys.getsizeof(button.callback_data)
+    return size
+
+
+class PageCache:
+    """LRU cache of per-user values tagged with a vocabulary version, capped in bytes."""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # (user_id, key) -> (version, value, size)
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, user_id: int, version: int, key):
+        """Get a value cached for a user at a version, or None."""
+        entry = self._entries.get((user_id, key))
+        if entry is None or entry[0] != version:
+            if entry is not None:
+                self._remove((user_id, key))
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end((user_id, key))
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, user_id: int, version: int, key, value) -> None:
+        """Cache a value computed from data read at a version of the user's vocabulary.
+        
+        Values computed from a version that is already outdated are not stored.
+        """
+        if version != db.get_vocab_version(user_id):
+            return
+        
+        size = value_size(value) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        
+        self._remove((user_id, key))
+        self._entries[(user_id, key)] = (version, value, size)
+        self.bytes += size
+        
+        while self.bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+    
+    def _remove(self, entry_key: tuple) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+    
+    def stats(self) -> dict:
+        """Get hit/miss counters and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache = PageCache(PAGE_CACHE_MAX_BYTES)
+
+
+def get(user_id: int, version: int, key):
+    """Get a value cached for a user at a version, or None."""
+    return _cache.get(user_id, version, key)
+
+
+def put(user_id: int, version: int, key, value) -> None:
+    """Cache a value computed from data read at a version of the user's vocabulary."""
+    _cache.put(user_id, version, key, value)
+
+
+def get_stats() -> dict:
+    """Get hit/miss counters and the current size of the page cache."""
+    return _cache.stats()
@@ -0,0 +1,207 @@
+"""SQLite persistence of conversation states and user data, so restarts keep running quizzes.
+
+python-telegram-bot hands changed data to the persistence every update_interval seconds.
+SQLitePersistence only buffers it in memory and writes each batch in one transaction on the
+database thread pool, so handling an update never waits for the disk. Conversation states
+are loaded at startup; user and chat data are loaded the first time a user comes back.
+"""
+
+import asyncio
+import json
+import logging
+import pickle
+from typing import Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import database as db
+import async_database as adb
+
+logger = logging.getLogger(__name__)
+
+# Marks buffered data that must be deleted instead of written
+_DROPPED = object()
+
+
+def load_data(kind: str, key: int):
+    """Load stored data of a kind by ID, or None if there is none. Blocking."""
+    data = db.get_persisted_data(kind, key)
+    return pickle.loads(data) if data is not None else None
+
+
+def load_conversations(name: str) -> dict:
+    """Load the states of all stored conversations of a handler. Blocking."""
+    return {
+        tuple(json.loads(key)): json.loads(state)
+        for key, state in db.get_persisted_conversations(name)
+    }
+
+
+def pickle_batch(data: dict) -> dict:
+    """Pickle buffered data, mapping (kind, id) to bytes, or to None for dropped data.
+    
+    Call on the event loop: handlers keep changing user data and quiz sessions there, so
+    pickling them on another thread could see them half-updated.
+    """
+    return {
+        key: None if value is _DROPPED else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        for key, value in data.items()
+    }
+
+
+def write_batch(data: dict, conversations: dict) -> None:
+    """Save buffered changes in one transaction. Blocking.
+    
+    data maps (kind, id) to pickled bytes (see pickle_batch) or None; conversations map
+    (name, key) to a state, or to None for an ended conversation.
+    """
+    db.save_persisted(
+        [(kind, key, value) for (kind, key), value in data.items() if value is not None],
+        [(kind, key) for (kind, key), value in data.items() if value is None],
+        [(name, json.dumps(key), json.dumps(state))
+         for (name, key), state in conversations.items() if state is not None],
+        [(name, json.dumps(key)) for (name, key), state in conversations.items() if state is None],
+    )
+
+
+class SQLitePersistence(BasePersistence):
+    """Write-behind persistence backed by the bot's SQLite database."""
+    
+    def __init__(self, store_data: Optional[PersistenceInput] = None, update_interval: float = 60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self._pending_data = {}
+        self._pending_conversations = {}
+        self._write_task: Optional[asyncio.Task] = None
+        # Users and chats whose stored data was already merged into memory
+        self._loaded = {"user": set(), "chat": set()}
+        # Handler name -> keys of the conversations not yet ended
+        self._open_conversations = {}
+    
+    def _buffer(self, kind: str, key: int, value) -> None:
+        self._pending_data[(kind, key)] = value
+        self._schedule_write()
+    
+    def _schedule_write(self) -> None:
+        # The application passes all changes of one run at once, so the first change
+        # starts a task that runs after the rest were buffered and writes them together
+        if self._write_task is None:
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+    
+    async def _write_pending(self) -> None:
+        try:
+            while self._pending_data or self._pending_conversations:
+                data, self._pending_data = self._pending_data, {}
+                conversations, self._pending_conversations = self._pending_conversations, {}
+                try:
+                    await adb.run(write_batch, pickle_batch(data), conversations)
+                except Exception:
+                    logger.exception("Could not save %d persisted items", len(data) + len(conversations))
+                    # Keep the batch for the next run unless newer changes replaced it
+                    for key, value in data.items():
+                        self._pending_data.setdefault(key, value)
+                    for key, state in conversations.items():
+                        self._pending_conversations.setdefault(key, state)
+                    return
+        finally:
+            self._write_task = None
+    
+    async def _refresh(self, kind: str, key: int, data: dict) -> None:
+        loaded = self._loaded[kind]
+        if key in loaded:
+            return
+        stored = await adb.run(load_data, kind, key)
+        loaded.add(key)
+        # Anything set since the restart is newer than the stored data
+        for name, value in (stored or {}).items():
+            data.setdefault(name, value)
+    
+    async def get_user_data(self) -> dict:
+        """Start with no user data; users are restored on their first update."""
+        return {}
+    
+    async def get_chat_data(self) -> dict:
+        """Start with no chat data; chats are restored on their first update."""
+        return {}
+    
+    async def get_bot_data(self) -> dict:
+        """Load the stored bot data."""
+        return await adb.run(load_data, "bot", 0) or {}
+    
+    async def get_callback_data(self) -> Optional[tuple]:
+        """Load the stored callback data cache."""
+        return await adb.run(load_data, "callback", 0)
+    
+    async def get_conversations(self, name: str) -> dict:
+        """Load the states of all stored conversations of a handler."""
+        conversations = await adb.run(load_conversations, name)
+        logger.info("Restored %d %s conversations", len(conversations), name)
+        self._open_conversations[name] = set(conversations)
+        return conversations
+    
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        """Buffer a conversation state change."""
+        self._pending_conversations[(name, key)] = new_state
+        open_keys = self._open_conversations.setdefault(name, set())
+        if new_state is None:
+            open_keys.discard(key)
+        else:
+            open_keys.add(key)
+        self._schedule_write()
+    
+    def conversation_counts(self) -> dict:
+        """Get the number of conversations not yet ended by handler name, as of the last save.
+        
+        Call from the event loop.
+        """
+        return {name: len(keys) for name, keys in self._open_conversations.items()}
+    
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        """Buffer changed user data."""
+        # Every update marks its user as changed, even when no handler ran and the
+        # stored data was never restored; an empty dict must not overwrite it then
+        if user_id not in self._loaded["user"] and not data:
+            return
+        self._loaded["user"].add(user_id)
+        self._buffer("user", user_id, data)
+    
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        """Buffer changed chat data."""
+        if chat_id not in self._loaded["chat"] and not data:
+            return
+        self._loaded["chat"].add(chat_id)
+        self._buffer("chat", chat_id, data)
+    
+    async def update_bot_data(self, data: dict) -> None:
+        """Buffer changed bot data."""
+        self._buffer("bot", 0, data)
+    
+    async def update_callback_data(self, data: tuple) -> None:
+        """Buffer the changed callback data cache."""
+        self._buffer("callback", 0, data)
+    
+    async def drop_user_data(self, user_id: int) -> None:
+        """Buffer the deletion of a user's data."""
+        self._buffer("user", user_id, _DROPPED)
+    
+    async def drop_chat_data(self, chat_id: int) -> None:
+        """Buffer the deletion of a chat's data."""
+        self._buffer("chat", chat_id, _DROPPED)
+    
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        """Restore a user's stored data on their first update since the start."""
+        await self._refresh("user", user_id, user_data)
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        """Restore a chat's stored data on its first update since the start."""
+        await self._refresh("chat", chat_id, chat_data)
+    
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        """Bot data is loaded once at startup."""
+    
+    async def flush(self) -> None:
+        """Write everything still buffered. Called by the application on shutdown."""
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending_data or self._pending_conversations:
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+            await self._write_task
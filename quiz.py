@@ -0,0 +1,249 @@
+"""Compact quiz session state.
+
+A quiz session only keeps the word IDs of its deck, a seed and its progress. The deck
+order is a seeded permutation computed one position at a time, so starting a quiz never
+shuffles or loads the whole vocabulary. Word rows are fetched lazily, a few questions
+ahead, into a read-only WordTable that is shared by every session of the same user.
+"""
+
+import random
+import sys
+import weakref
+from array import array
+from typing import Optional
+
+# Columns a quiz needs; user_id and created_at are not kept in memory
+QUIZ_COLUMNS = ("id", "word_type", "word1", "word2", "word3")
+# Rows fetched ahead of the current question
+PREFETCH_ROWS = 16
+# Random words used to build a session's distractor index on large vocabularies
+DISTRACTOR_SAMPLE_SIZE = 500
+
+_tables = weakref.WeakValueDictionary()
+
+
+def deep_sizeof(obj) -> int:
+    """Approximate memory used by an object and the containers/strings it holds."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+
+class WordTable:
+    """Read-only word rows of one user, filled lazily and shared by the user's quiz sessions."""
+    
+    __slots__ = ("user_id", "by_id", "__weakref__")
+    
+    def __init__(self, user_id: int, words: list = ()):
+        self.user_id = user_id
+        self.by_id = {}
+        self.add_rows(words)
+    
+    def __len__(self) -> int:
+        return len(self.by_id)
+    
+    def add_rows(self, words: list) -> None:
+        """Store fetched rows, keeping only the columns a quiz needs."""
+        for word in words:
+            self.by_id[word["id"]] = {column: word.get(column) for column in QUIZ_COLUMNS}
+    
+    def get(self, word_id: int) -> Optional[dict]:
+        """Get a word row by ID if it was fetched. The row must not be modified."""
+        return self.by_id.get(word_id)
+    
+    def missing(self, word_ids) -> list:
+        """List the IDs whose rows have not been fetched yet."""
+        return [word_id for word_id in word_ids if word_id not in self.by_id]
+    
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the fetched rows."""
+        return sys.getsizeof(self) + deep_sizeof(self.by_id)
+
+
+def get_word_table(user_id: int) -> WordTable:
+    """Get the word table shared by a user's sessions, creating an empty one if needed."""
+    table = _tables.get(user_id)
+    if table is None:
+        table = WordTable(user_id)
+        _tables[user_id] = table
+    return table
+
+
+def invalidate_word_table(user_id: int) -> None:
+    """Stop sharing a user's word table after their vocabulary changed.
+    
+    Running sessions keep their rows; new sessions start from a fresh table.
+    """
+    _tables.pop(user_id, None)
+
+
+def _feistel_round(value: int, key: int, mask: int) -> int:
+    """Round function of the deck permutation: a cheap 32-bit integer mix."""
+    value = ((value ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+    value ^= value >> 15
+    return ((value * 0x85EBCA6B) & 0xFFFFFFFF) & mask
+
+
+def permuted_position(position: int, size: int, seed: int) -> int:
+    """Map a position in [0, size) to its place in the seeded random order of the deck.
+    
+    A balanced Feistel network is a bijection on [0, 4^k); cycle walking restricts it
+    to [0, size). Different positions map to different places, so a deck walked from
+    0 to size - 1 visits each word exactly once.
+    """
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    keys = [(seed + round_number * 0x9E3779B9) & 0xFFFFFFFF for round_number in range(4)]
+    
+    value = position
+    while True:
+        left, right = value >> half_bits, value & mask
+        for key in keys:
+            left, right = right, left ^ _feistel_round(right, key, mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+def answer_buckets(row: dict) -> list:
+    """List (bucket key, answer) pairs a word contributes to the distractor index.
+    
+    A translation can be asked in both directions, so its English word answers
+    ('translation', 'word1') questions and its Russian word answers ('translation', 'word2')
+    questions. An irregular verb answers questions of its own form pair.
+    """
+    if row["word_type"] == "translation":
+        return [(("translation", "word1"), row["word1"]), (("translation", "word2"), row["word2"])]
+    return [(("irregular", row["word3"]), row["word2"])]
+
+
+class DistractorIndex:
+    """Distinct answers bucketed by word type and question direction or form pair.
+    
+    Built once per session so that picking wrong answers does not scan the pool.
+    """
+    
+    __slots__ = ("buckets", "_seen", "complete", "topped_up")
+    
+    def __init__(self, rows, complete: bool = True):
+        self.buckets = {}
+        self._seen = {}
+        # False when built from a sample, so small buckets may be missing answers
+        self.complete = complete
+        self.topped_up = set()
+        self.add_rows(rows)
+    
+    def add_rows(self, rows) -> None:
+        """Add the answers of more rows, ignoring answers already in their bucket."""
+        for row in rows:
+            for key, answer in answer_buckets(row):
+                seen = self._seen.setdefault(key, set())
+                if answer not in seen:
+                    seen.add(answer)
+                    self.buckets.setdefault(key, []).append(answer)
+    
+    def needs_top_up(self, row: dict) -> bool:
+        """Check whether a sampled index may lack wrong answers for a word's buckets."""
+        if self.complete or (row["word_type"], row["word3"]) in self.topped_up:
+            return False
+        return any(len(self.buckets.get(key, [])) < 4 for key, _ in answer_buckets(row))
+    
+    def top_up(self, row: dict, rows: list) -> None:
+        """Add rows fetched for the buckets of a word, so they are only fetched once."""
+        self.add_rows(rows)
+        self.topped_up.add((row["word_type"], row["word3"]))
+    
+    def sample(self, key: tuple, correct_answer: str, count: int = 3, exclude=()) -> list:
+        """Pick up to count distinct answers from a bucket, never the correct or an excluded one."""
+        answers = self.buckets.get(key, [])
+        
+        if len(answers) <= count + 1 + len(exclude):
+            wrong = [answer for answer in answers if answer != correct_answer and answer not in exclude]
+            return random.sample(wrong, min(count, len(wrong)))
+        
+        # Few answers can be rejected, so this ends after O(count) tries
+        picked = []
+        while len(picked) < count:
+            answer = answers[random.randrange(len(answers))]
+            if answer != correct_answer and answer not in picked and answer not in exclude:
+                picked.append(answer)
+        return picked
+    
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the index."""
+        return sys.getsizeof(self) + deep_sizeof(self.buckets) + deep_sizeof(self._seen)
+
+
+class QuizSession:
+    """Progress of one quiz: the deck of word IDs, its seed, current position and score."""
+    
+    __slots__ = ("table", "word_ids", "seed", "index", "score", "current_question", "hard", "deck_answers",
+                 "distractors")
+    
+    def __init__(self, table: WordTable, word_ids, hard: bool = False, seed: Optional[int] = None,
+                 deck_answers: bool = True):
+        self.table = table
+        self.word_ids = array("q", word_ids)
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.index = 0
+        self.score = 0
+        self.current_question = None
+        # Hard sessions pick wrong answers that look like the correct one
+        self.hard = hard
+        # Whether wrong answers come from the deck only, else from the whole vocabulary
+        self.deck_answers = deck_answers
+        self.distractors = None
+    
+    @property
+    def total(self) -> int:
+        return len(self.word_ids)
+    
+    @property
+    def finished(self) -> bool:
+        return self.index >= len(self.word_ids)
+    
+    def word_id_at(self, index: int) -> int:
+        """Get the ID of the word asked by the question at an index."""
+        return self.word_ids[permuted_position(index, len(self.word_ids), self.seed)]
+    
+    def upcoming_ids(self, count: int = PREFETCH_ROWS) -> list:
+        """Get the IDs of the current and next few questions."""
+        end = min(self.index + count, len(self.word_ids))
+        return [self.word_id_at(index) for index in range(self.index, end)]
+    
+    def sample_ids(self, count: int = DISTRACTOR_SAMPLE_SIZE) -> list:
+        """Get up to count random word IDs from the deck, or all of them for a small deck."""
+        if len(self.word_ids) <= count:
+            return list(self.word_ids)
+        return random.sample(self.word_ids, count)
+    
+    def __getstate__(self) -> dict:
+        # Pickled sessions (see persistence.py) keep only their own state. The shared
+        # word table and the distractor index are rebuilt lazily after a restore.
+        state = {name: getattr(self, name) for name in self.__slots__ if name not in ("table", "distractors")}
+        state["user_id"] = self.table.user_id
+        return state
+    
+    def __setstate__(self, state: dict) -> None:
+        self.table = get_word_table(state.pop("user_id"))
+        self.distractors = None
+        # Sessions stored before deck_answers existed may be review sessions
+        self.deck_answers = False
+        for name, value in state.items():
+            setattr(self, name, value)
+    
+    def current_word(self) -> Optional[dict]:
+        """Look up the row of the word asked by the current question."""
+        return self.table.get(self.word_id_at(self.index))
+    
+    def memory_usage(self) -> int:
+        """Approximate bytes owned by this session, excluding the shared word table."""
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.word_ids)
+            + deep_sizeof(self.current_question)
+            + (self.distractors.memory_usage() if self.distractors else 0)
+        )
@@ -0,0 +1,264 @@
+"""Outgoing Bot API request scheduler with rate limits, priorities and edit coalescing.
+
+Telegram answers bursts of messages with flood errors (RetryAfter). PriorityRateLimiter sends
+message requests through a global token bucket (messages per second over all chats) and a
+token bucket per chat, and picks the next request to send by priority, so quiz feedback goes
+out ahead of word list browsing when messages queue up. A pending editMessageText for a message that gets edited
+again before it was sent is replaced by the newer edit and both callers get its result.
+
+Edits of word list pages are deferred: the handler gets True (what Telegram returns for edits
+of inline messages) as soon as the edit is queued, and failures are only logged. Otherwise
+the next tap of the user would wait behind the edit of the previous one, since a user's
+updates are handled one by one, and there would be nothing to coalesce. This way tapping
+"Forward" five times sends one edit instead of five.
+
+The priority of a request is that of the handler making it, set with the priority()
+decorator; requests outside a decorated handler get PRIORITY_NORMAL.
+"""
+
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_QUIZ = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BROWSING = 2
+
+# Requests that count towards Telegram's message limits; others are sent right away
+LIMITED_ENDPOINTS = {
+    "sendMessage", "editMessageText", "editMessageReplyMarkup", "sendDocument", "deleteMessage",
+}
+# Head start in seconds a request gets over requests one priority level lower; a request is
+# sent before later ones of its level, so lower priorities are delayed but never starved
+PRIORITY_STEP = 1.0
+# Per-chat buckets kept before idle ones are forgotten
+MAX_CHAT_BUCKETS = 10000
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=PRIORITY_NORMAL)
+
+
+def priority(level: int):
+    """Decorate a handler so that the requests it makes are queued with the given priority."""
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            token = _priority.set(level)
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                _priority.reset(token)
+        return wrapper
+    return decorator
+
+
+class QueueFull(TelegramError):
+    """Raised for a low priority request when the outgoing queue is full."""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average and bursts of up to burst requests."""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait until it is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+    
+    def idle(self) -> bool:
+        """Check whether the bucket would be full by now."""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class _Request:
+    __slots__ = ("priority", "callback", "args", "kwargs", "future", "started", "retries", "edit_key")
+    
+    def __init__(self, priority: int, callback, args, kwargs, edit_key: Optional[tuple]):
+        self.priority = priority
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+        self.started = False
+        self.retries = 0
+        self.edit_key = edit_key
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Rate limiter with a priority queue and coalescing of edits to the same message.
+    
+    rate_limit_args of a Bot method, if given, overrides the priority of the request.
+    """
+    
+    def __init__(self, overall_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_queue: int = 1000, max_retries: int = 2):
+        self.overall_rate = overall_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        
+        self._overall = TokenBucket(overall_rate, overall_rate)
+        self._chats = {}
+        # (send by, sequence, request) of requests allowed by their chat bucket
+        self._heap = []
+        self._sequence = itertools.count()
+        self._ready = asyncio.Event()
+        self._pending_edits = {}
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._dispatcher = None
+        self._sending = set()
+        self._deferred = set()
+        
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.retried = 0
+    
+    async def initialize(self) -> None:
+        """Start sending queued requests."""
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="PriorityRateLimiter:dispatch")
+    
+    async def shutdown(self) -> None:
+        """Send what is queued, then stop."""
+        while self._waiting or self._heap or self._sending or self._deferred:
+            await asyncio.sleep(0.05)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        logger.info("Outgoing request stats: %s", self.stats())
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint not in LIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+        
+        level = _priority.get() if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+        edit_key = None
+        deferred = False
+        if endpoint == "editMessageText" and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            deferred = level >= PRIORITY_BROWSING
+            pending = self._pending_edits.get(edit_key)
+            if pending is not None and not pending.started:
+                # The queued edit would be overwritten right away; send only this one
+                pending.callback, pending.args, pending.kwargs = callback, args, kwargs
+                self.coalesced += 1
+                return True if deferred else await asyncio.shield(pending.future)
+        
+        if self._waiting >= self.max_queue and level >= PRIORITY_BROWSING:
+            self.dropped += 1
+            raise QueueFull(f"Outgoing queue is full ({self._waiting} requests), dropped {endpoint}")
+        
+        request = _Request(level, callback, args, kwargs, edit_key)
+        if edit_key is not None:
+            self._pending_edits[edit_key] = request
+        self.queued += 1
+        if not deferred:
+            return await self._enqueue(request, chat_id)
+        
+        task = asyncio.create_task(self._enqueue(request, chat_id))
+        self._deferred.add(task)
+        task.add_done_callback(self._deferred_done)
+        return True
+    
+    async def _enqueue(self, request: _Request, chat_id) -> object:
+        """Wait for the chat's rate limit, then for the dispatcher to send the request."""
+        self._waiting += 1
+        try:
+            delay = self._chat_bucket(chat_id).reserve() if chat_id is not None else 0.0
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._push(request)
+            return await asyncio.shield(request.future)
+        finally:
+            self._waiting -= 1
+    
+    def _deferred_done(self, task: asyncio.Task) -> None:
+        self._deferred.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Deferred edit failed: %s", task.exception())
+    
+    def _push(self, request: _Request) -> None:
+        send_by = time.monotonic() + request.priority * PRIORITY_STEP
+        heapq.heappush(self._heap, (send_by, next(self._sequence), request))
+        self._ready.set()
+    
+    async def _dispatch(self) -> None:
+        while True:
+            while not self._heap:
+                self._ready.clear()
+                await self._ready.wait()
+            
+            delay = max(self._overall.reserve(), self._paused_until - time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            # A more urgent request may have arrived while waiting
+            _, _, request = heapq.heappop(self._heap)
+            request.started = True
+            if request.edit_key is not None and self._pending_edits.get(request.edit_key) is request:
+                del self._pending_edits[request.edit_key]
+            
+            task = asyncio.create_task(self._send(request))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+    
+    async def _send(self, request: _Request) -> None:
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as error:
+            retry_after = float(error.retry_after)
+            if request.retries >= self.max_retries:
+                self.dropped += 1
+                logger.warning("Flood limit hit %d times, dropping a request", request.retries + 1)
+                request.future.set_exception(error)
+                return
+            # Telegram asks to wait before sending anything else
+            self.retried += 1
+            request.retries += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._push(request)
+        except Exception as error:
+            request.future.set_exception(error)
+        else:
+            self.sent += 1
+            request.future.set_result(result)
+    
+    def stats(self) -> dict:
+        """Get request counters and the current queue length."""
+        return {
+            "queued": self.queued,
+            "waiting": self._waiting,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "retried": self.retried,
+        }
@@ -0,0 +1,174 @@
+"""Move users between database shards after a change of DB_SHARDS.
+
+Stop the bot, then run with the new number of shards (DB_SHARDS by default):
+
+    python reshard.py 4
+
+Every shard file found next to DATABASE_NAME is scanned and each user stored in a file other
+than the one database.shard_index picks for the new number of shards is moved there: the
+user's rows are copied to the new shard in one transaction, then deleted from the old one.
+A user interrupted between the two steps is copied again on the next run, so the tool can
+simply be rerun after a crash. Shard files beyond the new number are removed once empty.
+
+Words get new IDs in their new file. Quizzes and add-word dialogs in progress of moved users
+refer to words by ID, so they are reset.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+
+import database as db
+
+
+def existing_shards() -> list:
+    """Get the indexes of the shard files that exist, 0 first."""
+    root, extension = os.path.splitext(db.DATABASE_NAME)
+    indexes = {0} if os.path.exists(db.DATABASE_NAME) else set()
+    for path in glob.glob(f"{glob.escape(root)}.*{extension}"):
+        middle = path[len(root) + 1:len(path) - len(extension)]
+        if middle.isdigit():
+            indexes.add(int(middle))
+    return sorted(indexes)
+
+
+def shard_users(path: str) -> list:
+    """Get the IDs of the users with a row or a word in a shard file."""
+    with db.get_connection(path=path) as conn:
+        rows = conn.execute("SELECT user_id FROM users UNION SELECT user_id FROM words").fetchall()
+    return [row[0] for row in rows]
+
+
+def move_user(user_id: int, source: str, target: str) -> int:
+    """Copy a user's rows from the source file to the target file, then delete them from the source.
+    
+    Returns the number of words moved.
+    """
+    with db.get_connection(path=source) as conn:
+        user = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        words = conn.execute("SELECT * FROM words WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        reviews = {
+            row["word_id"]: row
+            for row in conn.execute("SELECT * FROM reviews WHERE user_id = ?", (user_id,))
+        }
+    
+    with db.get_connection(path=target) as conn:
+        cursor = conn.cursor()
+        # Left over from an interrupted run; the source still has everything
+        cursor.execute("DELETE FROM words WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        if user is not None:
+            columns = user.keys()
+            cursor.execute(
+                f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(user)
+            )
+        for word in words:
+            columns = [column for column in word.keys() if column != "id"]
+            cursor.execute(
+                f"INSERT INTO words ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [word[column] for column in columns]
+            )
+            # The insert trigger created a fresh schedule; carry over the old one
+            review = reviews.get(word["id"])
+            if review is not None:
+                columns = [column for column in review.keys() if column not in ("word_id", "user_id")]
+                cursor.execute(
+                    f"UPDATE reviews SET {', '.join(f'{column} = ?' for column in columns)} WHERE word_id = ?",
+                    [review[column] for column in columns] + [cursor.lastrowid]
+                )
+        conn.commit()
+    
+    with db.get_connection(path=source) as conn:
+        conn.execute("DELETE FROM words WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        conn.commit()
+    
+    return len(words)
+
+
+def reset_persisted_state(user_ids: set) -> int:
+    """Drop the stored user data and conversations of the given users. Returns the rows dropped."""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "DELETE FROM persisted_data WHERE kind = 'user' AND id = ?",
+            [(user_id,) for user_id in user_ids]
+        )
+        dropped = cursor.rowcount
+        # Conversation keys are [chat_id, user_id]
+        ended = [
+            (name, key) for name, key in cursor.execute("SELECT name, key FROM persisted_conversations")
+            if json.loads(key)[-1] in user_ids
+        ]
+        cursor.executemany("DELETE FROM persisted_conversations WHERE name = ? AND key = ?", ended)
+        conn.commit()
+    return dropped + len(ended)
+
+
+def remove_shard_file(path: str) -> bool:
+    """Delete a shard file with its WAL files if it holds no users. Returns True if deleted."""
+    if shard_users(path):
+        return False
+    db.close_pools()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return True
+
+
+def reshard(shards: int) -> dict:
+    """Move every user to their shard for the given number of shards."""
+    started = time.perf_counter()
+    db.SHARDS = shards
+    db.init_db()
+    
+    moved = set()
+    words = 0
+    for index in existing_shards():
+        source = db.shard_path(index)
+        db.init_db_file(source)
+        for user_id in shard_users(source):
+            target = db.shard_index(user_id, shards)
+            if target != index:
+                words += move_user(user_id, source, db.shard_path(target))
+                moved.add(user_id)
+    
+    reset = reset_persisted_state(moved) if moved else 0
+    removed = [
+        db.shard_path(index) for index in existing_shards()
+        if index >= shards and remove_shard_file(db.shard_path(index))
+    ]
+    db.close_pools()
+    return {
+        "shards": shards,
+        "users_moved": len(moved),
+        "words_moved": words,
+        "persisted_rows_reset": reset,
+        "files_removed": removed,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main() -> int:
+    """Reshard to the number of shards given on the command line or DB_SHARDS."""
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else db.SHARDS
+    if shards < 1:
+        print("The number of shards must be at least 1")
+        return 1
+    
+    result = reshard(shards)
+    print(f"Moved {result['users_moved']} users with {result['words_moved']} words "
+          f"to {shards} shards in {result['seconds']:.1f} s")
+    if result["persisted_rows_reset"]:
+        print(f"Reset {result['persisted_rows_reset']} stored quizzes and dialogs of moved users")
+    for path in result["files_removed"]:
+        print(f"Removed empty {path}")
+    print(f"Set DB_SHARDS={shards} before starting the bot")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
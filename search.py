@@ -0,0 +1,140 @@
+"""Prefix search over a user's vocabulary, with a cache for search-as-you-type.
+
+Every word of the query must be the start of a word in word1 or word2, so "ta of" finds
+"take off". Searches run on the words_fts full-text index (see migrations.py).
+
+Inline queries arrive on every keystroke: "t", "ta", "tak", "take". Results are cached per
+user and query, tagged with the user's vocabulary version like page_cache. When a query
+extends a cached one whose result was complete (fewer rows than the limit), the answer is
+filtered from the cached rows without a query. The cache is only used from the event loop
+thread and needs no lock.
+"""
+
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import async_database as adb
+import database as db
+
+# Rows fetched per search; a result with fewer rows holds every match
+SEARCH_LIMIT = 50
+# Users whose results are kept, and cached queries per user
+CACHE_USERS = 10000
+CACHE_QUERIES_PER_USER = 16
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lowercase and drop diacritics of Latin letters, as the index's unicode61 tokenizer does.
+    
+    The tokenizer keeps other letters as they are, so "ё" does not match "е".
+    """
+    folded = []
+    for char in text.casefold():
+        base = unicodedata.normalize("NFKD", char)[0]
+        folded.append(base if base.isascii() else char)
+    return "".join(folded)
+
+
+def query_tokens(text: str) -> tuple:
+    """Split a search query into folded words."""
+    return tuple(TOKEN_PATTERN.findall(fold(text)))
+
+
+def build_match(tokens: tuple) -> str:
+    """Build an FTS5 query matching rows where every token starts a word of word1 or word2."""
+    return "{word1 word2} : (" + " ".join(f'"{token}"*' for token in tokens) + ")"
+
+
+def matches(word: dict, tokens: tuple) -> bool:
+    """Check a word row against query tokens the way the full-text index does."""
+    words = TOKEN_PATTERN.findall(fold(f"{word['word1']} {word['word2']}"))
+    return all(any(candidate.startswith(token) for candidate in words) for token in tokens)
+
+
+def _narrows(cached: tuple, tokens: tuple) -> bool:
+    """Check whether every match of tokens is also a match of the cached query."""
+    if not cached or len(cached) > len(tokens):
+        return False
+    last = len(cached) - 1
+    return cached[:last] == tokens[:last] and tokens[last].startswith(cached[last])
+
+
+class SearchCache:
+    """Recent search results per user, tagged with the user's vocabulary version."""
+    
+    def __init__(self, max_users: int = CACHE_USERS, queries_per_user: int = CACHE_QUERIES_PER_USER):
+        self.max_users = max_users
+        self.queries_per_user = queries_per_user
+        # user_id -> (version, OrderedDict of tokens -> (rows, complete))
+        self._users = OrderedDict()
+        self.hits = 0
+        self.refined = 0
+        self.misses = 0
+    
+    def get(self, user_id: int, version: int, tokens: tuple) -> Optional[list]:
+        """Get the rows of a query from the cache, or None if it has to be searched."""
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        
+        queries = entry[1]
+        if tokens in queries:
+            self.hits += 1
+            return queries[tokens][0]
+        for cached, (rows, complete) in reversed(queries.items()):
+            if complete and _narrows(cached, tokens):
+                self.refined += 1
+                found = [row for row in rows if matches(row, tokens)]
+                self.put(user_id, version, tokens, found, True)
+                return found
+        self.misses += 1
+        return None
+    
+    def put(self, user_id: int, version: int, tokens: tuple, rows: list, complete: bool) -> None:
+        """Cache the rows found for a query at a version of the user's vocabulary."""
+        if version != db.get_vocab_version(user_id):
+            return
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] != version:
+            entry = self._users[user_id] = (version, OrderedDict())
+        self._users.move_to_end(user_id)
+        
+        queries = entry[1]
+        queries[tokens] = (rows, complete)
+        queries.move_to_end(tokens)
+        if len(queries) > self.queries_per_user:
+            queries.popitem(last=False)
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+    
+    def stats(self) -> dict:
+        """Get hit counters and the number of cached users."""
+        return {"hits": self.hits, "refined": self.refined, "misses": self.misses, "users": len(self._users)}
+
+
+_cache = SearchCache()
+
+
+async def find_words(user_id: int, text: str) -> list:
+    """Get up to SEARCH_LIMIT words of a user matching a search query, by word1."""
+    tokens = query_tokens(text)
+    if not tokens:
+        return []
+    
+    version = db.get_vocab_version(user_id)
+    rows = _cache.get(user_id, version, tokens)
+    if rows is None:
+        rows = await adb.search_words(user_id, build_match(tokens), SEARCH_LIMIT)
+        _cache.put(user_id, version, tokens, rows, len(rows) < SEARCH_LIMIT)
+    return rows
+
+
+def get_stats() -> dict:
+    """Get search cache counters."""
+    return _cache.stats()
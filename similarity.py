@@ -0,0 +1,221 @@
+"""Trigram similarity index used to pick "hard" wrong answers that look like the right one.
+
+Each user gets one TrigramIndex per distractor bucket (see quiz.answer_buckets). Indexes are
+built on first use and then kept up to date by the database write listeners, so a lookup never
+rebuilds anything.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional
+
+import database as db
+import quiz
+
+# Only this many candidates sharing the most trigrams are ranked by edit distance
+CANDIDATES_TO_RANK = 16
+# Upper bound on posting entries counted per lookup, which bounds lookup time on big indexes
+SCAN_BUDGET = 2000
+# Texts whose length differs from the looked up text by more than this are not candidates
+MAX_LENGTH_DIFFERENCE = 2
+# Users whose indexes are kept in memory; the least recently used are dropped first
+MAX_INDEXED_USERS = 256
+
+
+def trigrams(text: str) -> set:
+    """Get the set of character trigrams of a word, padded so short words still have some."""
+    padded = f"  {text.casefold()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance between two strings.
+    
+    Uses the bit-parallel algorithm of Myers/Hyyrö: one pass over b with a few integer
+    operations per character instead of filling a len(a) x len(b) table.
+    """
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+    
+    match_masks = {}
+    for i, char in enumerate(a):
+        match_masks[char] = match_masks.get(char, 0) | (1 << i)
+    
+    all_ones = (1 << len(a)) - 1
+    last_bit = 1 << (len(a) - 1)
+    positive = all_ones
+    negative = 0
+    distance = len(a)
+    
+    for char in b:
+        match = match_masks.get(char, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & all_ones)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last_bit:
+            distance += 1
+        elif horizontal_negative & last_bit:
+            distance -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & all_ones
+        horizontal_negative = (horizontal_negative << 1) & all_ones
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & all_ones)
+        negative = horizontal_positive & vertical
+    
+    return distance
+
+
+class TrigramIndex:
+    """Inverted index from (trigram, text length) to the distinct texts that contain it.
+    
+    Keying postings by length keeps them short and lets a lookup skip texts whose
+    length alone makes them poor look-alikes.
+    """
+    
+    def __init__(self):
+        self._postings = {}
+        # How many words use each text, so a text is dropped with its last word
+        self._text_refs = Counter()
+        self._texts = {}
+    
+    def __len__(self) -> int:
+        return len(self._texts)
+    
+    def add(self, word_id: int, text: str) -> None:
+        """Index the text of a word."""
+        if word_id in self._texts:
+            self.remove(word_id)
+        self._texts[word_id] = text
+        self._text_refs[text] += 1
+        if self._text_refs[text] == 1:
+            for gram in trigrams(text):
+                self._postings.setdefault((gram, len(text)), set()).add(text)
+    
+    def remove(self, word_id: int) -> None:
+        """Remove a word from the index."""
+        text = self._texts.pop(word_id, None)
+        if text is None:
+            return
+        self._text_refs[text] -= 1
+        if self._text_refs[text] > 0:
+            return
+        del self._text_refs[text]
+        for gram in trigrams(text):
+            key = (gram, len(text))
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(text)
+                if not posting:
+                    del self._postings[key]
+    
+    def similar(self, text: str, count: int = 3, exclude=()) -> list:
+        """Get up to count distinct indexed texts most similar to text, never text itself.
+        
+        Postings of texts with a similar length are counted from the rarest trigram up
+        until SCAN_BUDGET entries were seen. The candidates sharing the most trigrams
+        are then ranked by edit distance.
+        """
+        grams = trigrams(text)
+        postings = []
+        for length in range(len(text) - MAX_LENGTH_DIFFERENCE, len(text) + MAX_LENGTH_DIFFERENCE + 1):
+            for gram in grams:
+                posting = self._postings.get((gram, length))
+                if posting is not None:
+                    postings.append(posting)
+        postings.sort(key=len)
+        
+        shared = Counter()
+        scanned = 0
+        for posting in postings:
+            if scanned and scanned + len(posting) > SCAN_BUDGET:
+                break
+            shared.update(posting)
+            scanned += len(posting)
+        
+        shared.pop(text, None)
+        for excluded in exclude:
+            shared.pop(excluded, None)
+        
+        candidates = [candidate for candidate, _ in shared.most_common(CANDIDATES_TO_RANK)]
+        candidates.sort(key=lambda candidate: (levenshtein(text, candidate), -shared[candidate]))
+        return candidates[:count]
+
+
+class UserSimilarityIndex:
+    """Trigram indexes of one user's answers, one per distractor bucket."""
+    
+    def __init__(self, words: list):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        for word in words:
+            self.add_word(word)
+    
+    def add_word(self, word: dict) -> None:
+        """Index a newly added word."""
+        with self._lock:
+            for key, answer in quiz.answer_buckets(word):
+                self._buckets.setdefault(key, TrigramIndex()).add(word["id"], answer)
+    
+    def remove_word(self, word_id: int) -> None:
+        """Remove a deleted word from every bucket."""
+        with self._lock:
+            for index in self._buckets.values():
+                index.remove(word_id)
+    
+    def similar(self, bucket: tuple, text: str, count: int = 3, exclude=()) -> list:
+        """Get answers from a bucket that look like text."""
+        with self._lock:
+            index = self._buckets.get(bucket)
+            return index.similar(text, count, exclude) if index else []
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(user_id: int) -> Optional[UserSimilarityIndex]:
+    """Get a user's similarity index if it is loaded."""
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+        return index
+
+
+def load_index(user_id: int) -> UserSimilarityIndex:
+    """Get a user's similarity index, building it from the database if needed. Blocking."""
+    index = get_index(user_id)
+    if index is not None:
+        return index
+    
+    index = UserSimilarityIndex(db.get_all_words(user_id))
+    with _indexes_lock:
+        index = _indexes.setdefault(user_id, index)
+        while len(_indexes) > MAX_INDEXED_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def drop_index(user_id: int) -> None:
+    """Forget a user's similarity index so that it is rebuilt on next use."""
+    with _indexes_lock:
+        _indexes.pop(user_id, None)
+
+
+def on_words_changed(event: str, user_id: int, payload) -> None:
+    """Database write listener that keeps loaded indexes in sync."""
+    index = get_index(user_id)
+    if index is None:
+        return
+    if event == "add":
+        index.add_word(payload)
+    elif event == "delete":
+        index.remove_word(payload)
+    elif event == "import":
+        # Rebuilt on the next hard quiz instead of indexing a large import word by word
+        drop_index(user_id)
+
+
+db.add_word_listener(on_words_changed)
@@ -0,0 +1,34 @@
+"""SM-2 spaced repetition scheduling for the review mode."""
+
+from datetime import datetime, timedelta
+
+# Answer grades on the SM-2 scale of 0 (blackout) to 5 (perfect recall)
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+
+MIN_EASE = 1.3
+# A forgotten word comes back in the same study session instead of tomorrow
+RELEARN_INTERVAL_DAYS = 10 / (24 * 60)
+
+
+def schedule(ease: float, interval_days: float, repetitions: int, quality: int, now: datetime) -> tuple:
+    """Compute the next review of a word after an answer.
+    
+    Returns (ease, interval_days, repetitions, due_at) where due_at is an ISO timestamp.
+    """
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    
+    if quality < 3:
+        repetitions = 0
+        interval_days = RELEARN_INTERVAL_DAYS
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval_days = 1
+        elif repetitions == 2:
+            interval_days = 6
+        else:
+            interval_days = round(interval_days * ease, 2)
+    
+    due_at = (now + timedelta(days=interval_days)).isoformat()
+    return ease, interval_days, repetitions, due_at
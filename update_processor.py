@@ -0,0 +1,131 @@
+"""Update processor that handles different users in parallel and each user's updates in order.
+
+Quiz and add-word state lives in user_data and conversation states, so two updates of one
+user must never run at the same time: a fast double click on an answer would otherwise count
+twice. UserOrderedUpdateProcessor keeps one queue per user and runs the queues of up to
+max_workers users at once.
+
+python-telegram-bot hands updates to the processor one at a time and waits for each hand-over
+when max_concurrent_updates is 1, so the processor reports 1 and returns as soon as an update
+is queued. When max_pending updates are queued the hand-over waits for room, which stops
+the application from taking more updates from its (bounded) update queue and in turn pauses
+polling or webhook deliveries.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object) -> Optional[int]:
+    """Get the ID whose updates must be handled in order: the user's, else the chat's."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else None
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates of up to max_workers users concurrently, one update per user at a time.
+    
+    At most max_pending updates are queued or running; more wait in the hand-over. A user
+    with max_pending_per_user updates queued is flooding the bot and further updates of
+    that user are dropped, so one user cannot stall everybody else.
+    """
+    
+    def __init__(self, max_workers: int = 16, max_pending: int = 1000, max_pending_per_user: int = 20):
+        # The application must await every hand-over, see the module docstring
+        super().__init__(max_concurrent_updates=1)
+        if max_workers < 1:
+            raise ValueError("max_workers must be a positive integer")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        
+        # Ordering key -> queued coroutines; present while the key has a drain task
+        self._queues = {}
+        self._tasks = set()
+        self._workers = asyncio.Semaphore(max_workers)
+        self._room = asyncio.Event()
+        self._pending = 0
+        
+        self.processed = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.peak_pending = 0
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        """Queue an update behind the earlier updates of its user."""
+        key = ordering_key(update)
+        queue = self._queues.get(key)
+        
+        if queue is not None and len(queue) >= self.max_pending_per_user:
+            self.dropped += 1
+            coroutine.close()
+            logger.warning("Dropped an update of %s: %d updates already queued", key, len(queue))
+            return
+        
+        while self._pending >= self.max_pending:
+            self.backpressure_waits += 1
+            self._room.clear()
+            await self._room.wait()
+            # The user's drain task may have finished while waiting
+            queue = self._queues.get(key)
+        
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+        
+        self._queues[key] = deque([coroutine])
+        task = asyncio.create_task(self._drain(key), name=f"UserOrderedUpdateProcessor:{key}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _drain(self, key: Optional[int]) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                coroutine = queue.popleft()
+                try:
+                    async with self._workers:
+                        await coroutine
+                except Exception:
+                    # Application.process_update reports handler errors itself
+                    logger.exception("Processing an update of %s failed", key)
+                finally:
+                    self.processed += 1
+                    self._pending -= 1
+                    self._room.set()
+        finally:
+            del self._queues[key]
+    
+    async def drain(self) -> None:
+        """Wait until every queued update has been handled."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def stats(self) -> dict:
+        """Get update counters and queue sizes."""
+        return {
+            "processed": self.processed,
+            "pending": self._pending,
+            "peak_pending": self.peak_pending,
+            "active_users": len(self._queues),
+            "dropped": self.dropped,
+            "backpressure_waits": self.backpressure_waits,
+        }
+    
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+    
+    async def shutdown(self) -> None:
+        """Finish the queued updates."""
+        await self.drain()
@@ -0,0 +1,276 @@
+"""Run the bot as a front process and several worker processes, one user per worker.
+
+A single process runs handlers on one core. Here the front process only receives updates,
+by long polling or webhook as bot.py would, and hands each update to the worker picked by a
+hash of the user's ID (database.shard_index, so with DB_SHARDS equal to WORKERS every worker
+writes to its own database file). The workers run the bot's handlers as usual, each with its
+own connection pools and caches. A user always lands on the same worker, so their user_data,
+conversation state and cached words stay in one process and their updates stay in order.
+
+    python workers.py
+
+Updates are sent to the workers in batches over pipes. When a worker falls behind, its
+pipe fills up, the front stops taking updates and polling or webhook deliveries slow down.
+
+Stopping the front (Ctrl+C or SIGTERM) stops fetching updates, hands the fetched ones to
+the workers and lets each worker finish its queue, save persistence and exit. SIGUSR1 adds
+a worker and SIGUSR2 removes one: new updates are held back while the workers are stopped
+this way, then a new set of workers starts with the stored state and the held updates are
+routed over it. A worker that dies is restarted.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+import sys
+from typing import Optional
+
+from telegram import Bot, Update
+from telegram.ext import Updater
+
+import bot
+from config import (
+    BOT_TOKEN,
+    BOT_API_URL,
+    MAX_PENDING_UPDATES,
+    METRICS_PORT,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    WORKERS,
+)
+import database as db
+from update_processor import ordering_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker gets to finish its queue and save its state when stopped
+WORKER_STOP_TIMEOUT = 60
+# Seconds between checks that the workers are alive
+WORKER_CHECK_INTERVAL = 1.0
+
+
+def run_worker(index: int, count: int, connection) -> None:
+    """Entry point of a worker process: handle the updates received over the connection."""
+    # The front decides when workers stop; Ctrl+C reaches the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_serve(index, count, connection))
+
+
+async def _serve(index: int, count: int, connection) -> None:
+    logger.info("Worker %d/%d: loaded %d registered users", index + 1, count, db.load_known_users())
+    application = bot.build_application(
+        rate_limit_share=1 / count,
+        metrics_port=METRICS_PORT + index if METRICS_PORT else 0,
+        updater=False
+    )
+    loop = asyncio.get_running_loop()
+    
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, connection.recv)
+            except EOFError:
+                logger.warning("Worker %d: the front process is gone", index + 1)
+                break
+            if batch is None:
+                break
+            for data in batch:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        
+        # Updates queued before the stop are handled first
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+    logger.info("Worker %d stopped", index + 1)
+
+
+class Worker:
+    """A worker process and the updates waiting to be sent to it."""
+    
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+        self.outbox = []
+        self.has_updates = asyncio.Event()
+        self.has_room = asyncio.Event()
+        self.has_room.set()
+        self.process = None
+        self.connection = None
+        self.sender = None
+        self.closing = False
+        self.sent = 0
+    
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        receiver, self.connection = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=run_worker, args=(self.index, self.count, receiver), name=f"worker-{self.index + 1}"
+        )
+        self.process.start()
+        receiver.close()
+        self.sender = asyncio.create_task(self._send(), name=f"Worker:{self.index + 1}")
+    
+    async def _send(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self.has_updates.wait()
+                self.has_updates.clear()
+                batch, self.outbox = self.outbox, []
+                self.has_room.set()
+                if batch:
+                    # Blocks while the worker's pipe is full
+                    await loop.run_in_executor(None, self.connection.send, batch)
+                    self.sent += len(batch)
+                if self.closing and not self.outbox:
+                    await loop.run_in_executor(None, self.connection.send, None)
+                    return
+        except OSError as error:
+            # The worker died; watch() restarts it
+            logger.error("Sending updates to worker %d failed: %s", self.index + 1, error)
+    
+    async def put(self, data: dict) -> None:
+        while len(self.outbox) >= MAX_PENDING_UPDATES:
+            self.has_room.clear()
+            await self.has_room.wait()
+        self.outbox.append(data)
+        self.has_updates.set()
+    
+    async def stop(self) -> None:
+        """Send what is queued, then let the worker finish and exit."""
+        loop = asyncio.get_running_loop()
+        self.closing = True
+        self.has_updates.set()
+        await self.sender
+        await loop.run_in_executor(None, self.process.join, WORKER_STOP_TIMEOUT)
+        if self.process.is_alive():
+            logger.warning("Worker %d did not stop in time, terminating it", self.index + 1)
+            self.process.terminate()
+        self.connection.close()
+
+
+class WorkerPool:
+    """Routes updates to worker processes by user."""
+    
+    def __init__(self, count: int):
+        self.count = count
+        self.workers = []
+        self._held = None
+        self._resizing = asyncio.Lock()
+        self.restarts = 0
+    
+    def start(self) -> None:
+        self.workers = [Worker(index, self.count) for index in range(self.count)]
+        for worker in self.workers:
+            worker.start()
+        logger.info("Started %d workers", self.count)
+    
+    async def dispatch(self, update: Update) -> None:
+        if self._held is not None:
+            self._held.append(update)
+            return
+        key = ordering_key(update)
+        worker = self.workers[db.shard_index(key, self.count) if key is not None else 0]
+        await worker.put(update.to_dict())
+    
+    async def stop(self) -> None:
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        logger.info("Workers stopped; updates sent: %s", [worker.sent for worker in self.workers])
+    
+    async def resize(self, count: int) -> None:
+        """Stop all workers, then start count workers and route the held back updates over them."""
+        async with self._resizing:
+            if count < 1 or count == self.count:
+                return
+            logger.info("Rebalancing from %d to %d workers", self.count, count)
+            self._held = []
+            await self.stop()
+            self.count = count
+            self.start()
+            held, self._held = self._held, None
+            for update in held:
+                await self.dispatch(update)
+    
+    async def watch(self) -> None:
+        """Restart workers that died."""
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            if self._resizing.locked():
+                continue
+            for worker in self.workers:
+                if not worker.process.is_alive():
+                    logger.error("Worker %d exited with code %s, restarting it",
+                                 worker.index + 1, worker.process.exitcode)
+                    self.restarts += 1
+                    worker.sender.cancel()
+                    worker.connection.close()
+                    worker.closing = False
+                    worker.start()
+                    worker.has_updates.set()
+
+
+async def run_front(count: int) -> None:
+    """Receive updates and hand them to count worker processes until stopped."""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    pool = WorkerPool(count)
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(pool.resize(pool.count + 1)))
+    loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.create_task(pool.resize(pool.count - 1)))
+    
+    update_queue = asyncio.Queue(maxsize=bot.UPDATE_QUEUE_SIZE)
+    updater = Updater(Bot(BOT_TOKEN, base_url=BOT_API_URL), update_queue)
+    pool.start()
+    watcher = asyncio.create_task(pool.watch())
+    
+    async def forward() -> None:
+        while True:
+            await pool.dispatch(await update_queue.get())
+    
+    async with updater:
+        if WEBHOOK_URL:
+            logger.info("Front started with webhook on %s:%d", WEBHOOK_LISTEN, WEBHOOK_PORT)
+            await updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=bot.ALLOWED_UPDATES,
+            )
+        else:
+            logger.info("Front started!")
+            await updater.start_polling(allowed_updates=bot.ALLOWED_UPDATES)
+        forwarder = asyncio.create_task(forward())
+        
+        await stop.wait()
+        logger.info("Stopping")
+        await updater.stop()
+        forwarder.cancel()
+        watcher.cancel()
+        while not update_queue.empty():
+            await pool.dispatch(update_queue.get_nowait())
+        await pool.stop()
+
+
+def main(count: Optional[int] = None) -> None:
+    """Run the bot with WORKERS worker processes."""
+    db.init_db()
+    asyncio.run(run_front(count or WORKERS))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)